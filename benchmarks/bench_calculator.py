@@ -0,0 +1,50 @@
+# Запуск из корня репозитория: python -m benchmarks.bench_calculator [число_значений]
+import random
+import sys
+import time
+
+from managers.calc import Calculator
+from managers.expressions import Expression
+
+FORMULA = '(amount * 1.2 - fee) / (1 + rate) ** 2 + sqrt(abs(amount))'
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def reparse(amounts):
+    # Так считала бы любая реализация без кэша: разбор текста на каждое значение
+    return [Expression(FORMULA).evaluate({'amount': amount, 'fee': 10.0, 'rate': 0.05}) for amount in amounts]
+
+
+def cached(amounts):
+    calculator = Calculator()
+    return [calculator.evaluate(FORMULA, {'amount': amount, 'fee': 10.0, 'rate': 0.05}) for amount in amounts]
+
+
+def compiled(amounts):
+    function = Expression(FORMULA).function
+    return [function(amount, 10.0, 0.05) for amount in amounts]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    rng = random.Random(15)
+    amounts = [rng.uniform(-5000, 5000) for _ in range(count)]
+
+    reparse_time, expected = timed(reparse, amounts)
+    cached_time, result = timed(cached, amounts)
+    compiled_time, compiled_result = timed(compiled, amounts)
+
+    assert result == expected == compiled_result
+    print(f"Значений: {count}")
+    print(f"Разбор каждый раз:        {reparse_time:.3f} с")
+    print(f"Кэш выражений:            {cached_time:.3f} с (ускорение x{reparse_time / cached_time:.0f})")
+    print(f"Скомпилированная функция: {compiled_time:.3f} с (ускорение x{reparse_time / compiled_time:.0f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# Запуск из корня репозитория: python -m benchmarks.bench_codecs [число_записей]
+import io
+import json
+import sys
+import time
+
+from benchmarks.bench_finance_columns import make_records
+from managers.codecs import CODECS
+from managers.finances import STORE_FIELDS, FinanceManager
+
+
+class LegacyJson:
+    # Прежнее сохранение: json.dump списка словарей целиком
+    name = 'json (старый)'
+
+    @staticmethod
+    def write(file, rows, fields):
+        file.write(json.dumps(rows).encode())
+
+    @staticmethod
+    def load(data):
+        return json.loads(data)
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def save(codec, rows):
+    buffer = io.BytesIO()
+    codec.write(buffer, rows, STORE_FIELDS)
+    return buffer.getvalue()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    manager = FinanceManager('bench_codecs.json')
+    rows = [manager.record_to_row(record) for record in make_records(count)]
+    print(f"Записей: {count}")
+    print(f"{'формат':14} {'сохранение':>11} {'загрузка':>9} {'размер':>9}")
+    for codec in [LegacyJson, *CODECS.values()]:
+        save_time, data = timed(save, codec, rows)
+        load_time, loaded = timed(codec.load, data)
+        assert loaded == rows, codec.name
+        print(f"{codec.name:14} {save_time:10.2f}с {load_time:8.2f}с {len(data) / 2 ** 20:7.1f}МБ")
+
+
+if __name__ == '__main__':
+    main()
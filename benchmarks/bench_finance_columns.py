@@ -0,0 +1,79 @@
+# Запуск из корня репозитория: python -m benchmarks.bench_finance_columns [число_записей]
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from managers.columnar import FinanceColumns
+from managers.numeric import numpy
+from managers.indexes import epoch_day
+from managers.finances import FinanceRecord
+from managers.money import from_cents
+
+CATEGORIES = ['Еда', 'Транспорт', 'Жильё', 'Зарплата', 'Развлечения', 'Здоровье', 'Связь', 'Подарки']
+
+
+def make_records(count, seed=11):
+    rng = random.Random(seed)
+    start = date(2020, 1, 1)
+    records = []
+    for record_id in range(1, count + 1):
+        record = FinanceRecord(
+            None,
+            rng.choice(CATEGORIES),
+            (start + timedelta(days=rng.randrange(5 * 365))).strftime("%d-%m-%Y"),
+            cents=rng.randrange(-500000, 500001),
+        )
+        record.id = record_id
+        records.append(record)
+    return records
+
+
+def rowwise(records, start_date, end_date):
+    # Построчный подсчёт в Decimal: точный, но медленный
+    income = sum(record.amount for record in records if record.amount > 0)
+    expense = sum(record.amount for record in records if record.amount < 0)
+    grouped = defaultdict(int)
+    for record in records:
+        grouped[record.category] += record.amount
+    # Так фильтровал диапазон прежний filter_records
+    in_range = [record for record in records if datetime.strptime(record.date, "%d-%m-%Y") >= datetime.strptime(start_date, "%d-%m-%Y")]
+    in_range = [record for record in in_range if datetime.strptime(record.date, "%d-%m-%Y") <= datetime.strptime(end_date, "%d-%m-%Y")]
+    range_income = sum(record.amount for record in in_range if record.amount > 0)
+    return income + expense, dict(grouped), range_income
+
+
+def columnar(columns, start_day, end_day):
+    income, expense = columns.totals()
+    grouped = {key: from_cents(cents) for key, cents in columns.by_category().items()}
+    range_income, _ = columns.totals(start_day, end_day)
+    return from_cents(income + expense), grouped, from_cents(range_income)
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    records = make_records(count)
+    start_date, end_date = '01-01-2022', '31-12-2022'
+    start_day, end_day = epoch_day(start_date), epoch_day(end_date)
+
+    build_time, columns = timed(FinanceColumns, records)
+    row_time, row_result = timed(rowwise, records, start_date, end_date)
+    column_time, column_result = timed(columnar, columns, start_day, end_day)
+
+    # Копейки складываются без округления, поэтому результаты совпадают точно
+    assert row_result == column_result
+    print(f"Записей: {count}, NumPy: {'да' if numpy() is not None else 'нет'}")
+    print(f"Построение колонок: {build_time:.3f} с")
+    print(f"Построчно:          {row_time:.3f} с")
+    print(f"Колонки:            {column_time:.3f} с (ускорение x{row_time / column_time:.1f})")
+
+
+if __name__ == '__main__':
+    main()
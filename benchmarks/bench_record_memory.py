@@ -0,0 +1,90 @@
+# Запуск из корня репозитория: python -m benchmarks.bench_record_memory [число_записей]
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from managers.contacts import ContactsManager
+from managers.finances import FinanceManager
+from managers.notes import NotesManager
+from managers.tasks import TaskManager
+
+CATEGORIES = ['Еда', 'Транспорт', 'Жильё', 'Зарплата', 'Развлечения', 'Здоровье', 'Связь', 'Подарки']
+PRIORITIES = ['Низкий', 'Средний', 'Высокий']
+
+
+class LegacyRecord:
+    # Так записи хранились раньше: обычный класс со словарём атрибутов
+    def __init__(self, row):
+        self.__dict__.update(row)
+
+
+def legacy_note(row):
+    note = LegacyRecord(row)
+    # Прежний Note.__init__ форматировал текущее время и тут же его перезаписывал
+    datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+    return note
+
+
+def make_rows(kind, count, seed=13):
+    rng = random.Random(seed)
+    start = date(2020, 1, 1)
+    rows = []
+    for row_id in range(1, count + 1):
+        day = (start + timedelta(days=rng.randrange(5 * 365))).strftime("%d-%m-%Y")
+        if kind == 'notes':
+            rows.append({'id': row_id, 'title': f'Заметка {row_id}', 'content': 'текст ' * 4, 'timestamp': day + ' 12:00:00'})
+        elif kind == 'tasks':
+            rows.append({'id': row_id, 'title': f'Задача {row_id}', 'description': '', 'done': False, 'priority': rng.choice(PRIORITIES), 'due_date': day})
+        elif kind == 'contacts':
+            rows.append({'id': row_id, 'name': f'Контакт {row_id}', 'phone': f'+7{rng.randrange(10 ** 10):010d}', 'email': None})
+        else:
+            rows.append({'id': row_id, 'cents': rng.randrange(-500000, 500001), 'category': rng.choice(CATEGORIES), 'date': day, 'description': ''})
+    # Строки после json.load — отдельные объекты в каждой записи, как при чтении файла
+    return json.dumps(rows)
+
+
+def current_loaders():
+    # Менеджеры не читают файлы до первого обращения, поэтому нужны только их конвертеры
+    return {
+        'notes': NotesManager('bench_notes.json').dict_to_note,
+        'tasks': TaskManager('bench_tasks.json').dict_to_task,
+        'contacts': ContactsManager('bench_contacts.json').dict_to_contact,
+        'finances': FinanceManager('bench_finance.json').dict_to_record,
+    }
+
+
+def measure(payload, loader):
+    gc.collect()
+    started = time.perf_counter()
+    records = list(map(loader, json.loads(payload)))
+    elapsed = time.perf_counter() - started
+    del records
+    gc.collect()
+    tracemalloc.start()
+    records = list(map(loader, json.loads(payload)))
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return elapsed, used
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    loaders = current_loaders()
+    print(f"Записей каждого типа: {count}")
+    for kind, loader in loaders.items():
+        payload = make_rows(kind, count)
+        old_loader = legacy_note if kind == 'notes' else LegacyRecord
+        old_time, old_memory = measure(payload, old_loader)
+        new_time, new_memory = measure(payload, loader)
+        print(f"{kind:9} память: {old_memory / 2 ** 20:8.1f} -> {new_memory / 2 ** 20:8.1f} МБ "
+              f"(x{old_memory / new_memory:.2f}), загрузка: {old_time:.2f} -> {new_time:.2f} с")
+
+
+if __name__ == '__main__':
+    main()
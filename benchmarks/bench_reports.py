@@ -0,0 +1,45 @@
+# Запуск из корня репозитория: python -m benchmarks.bench_reports [число_записей] [процессов]
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.generators import generate_rows
+from managers.finances import FinanceManager
+from managers.reports import month_periods
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def one_by_one(manager, periods):
+    return [manager.generate_report(start_date, end_date, compression='gzip', include_records=False) for start_date, end_date in periods]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        manager = FinanceManager('bench_reports.json')
+        manager.storage.write_snapshot(generate_rows('finances', count))
+        manager = FinanceManager('bench_reports.json')
+        # Колонки и индекс дат строятся один раз и не входят в замер
+        manager.columns
+        periods = month_periods(2022)
+
+        serial_time, expected = timed(one_by_one, manager, periods)
+        batch_time, reports = timed(lambda: manager.generate_reports(periods, compression='gzip', workers=workers))
+
+        for report, single in zip(reports, expected):
+            assert report['balance'] == single['balance']
+        print(f"Записей: {count}, отчётов: {len(periods)}, процессов: {workers}")
+        print(f"По одному отчёту: {serial_time:.2f} с")
+        print(f"Пакетом:          {batch_time:.2f} с (ускорение x{serial_time / batch_time:.1f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Детерминированные наборы данных для бенчмарков: одинаковые seed и размер дают одинаковые строки
+import random
+from datetime import date, timedelta
+
+CATEGORIES = ['Еда', 'Транспорт', 'Жильё', 'Зарплата', 'Развлечения', 'Здоровье', 'Связь', 'Подарки']
+PRIORITIES = ['Низкий', 'Средний', 'Высокий']
+WORDS = [
+    'отчёт', 'встреча', 'проект', 'бюджет', 'ремонт', 'поездка', 'покупки', 'врач', 'договор', 'идея',
+    'план', 'звонок', 'письмо', 'счёт', 'налог', 'отпуск', 'учёба', 'спорт', 'книга', 'подарок',
+]
+FIRST_NAMES = ['Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей', 'Елена', 'Дмитрий', 'Наталья', 'Алексей']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев', 'Козлов', 'Новиков']
+START = date(2020, 1, 1)
+DAYS = 5 * 365
+SCALES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000}
+
+
+def random_day(rng):
+    return (START + timedelta(days=rng.randrange(DAYS))).strftime("%d-%m-%Y")
+
+
+def phrase(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def note_row(rng, row_id):
+    return {
+        'id': row_id,
+        'title': f'{phrase(rng, 2)} {row_id}',
+        'content': phrase(rng, 12),
+        'timestamp': f'{random_day(rng)} {rng.randrange(24):02d}:{rng.randrange(60):02d}:00',
+    }
+
+
+def task_row(rng, row_id):
+    return {
+        'id': row_id,
+        'title': f'{phrase(rng, 2)} {row_id}',
+        'description': phrase(rng, 6),
+        'done': rng.random() < 0.3,
+        'priority': rng.choice(PRIORITIES),
+        'due_date': random_day(rng),
+    }
+
+
+def contact_row(rng, row_id):
+    name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+    return {
+        'id': row_id,
+        'name': f'{name} {row_id}',
+        'phone': f'+7{rng.randrange(10 ** 10):010d}',
+        'email': f'user{row_id}@example.com' if rng.random() < 0.7 else None,
+    }
+
+
+def finance_row(rng, row_id):
+    return {
+        'id': row_id,
+        'cents': rng.randrange(-500000, 500001),
+        'category': rng.choice(CATEGORIES),
+        'date': random_day(rng),
+        'description': phrase(rng, 3),
+    }
+
+
+GENERATORS = {'notes': note_row, 'tasks': task_row, 'contacts': contact_row, 'finances': finance_row}
+
+
+def generate_rows(kind, count, seed=13):
+    # Строки в формате хранилища соответствующего менеджера
+    rng = random.Random(f'{kind}:{seed}')
+    make_row = GENERATORS[kind]
+    return [make_row(rng, row_id) for row_id in range(1, count + 1)]
+
+
+def parse_scale(value):
+    if value in SCALES:
+        return SCALES[value]
+    return int(value.replace('_', ''))
@@ -0,0 +1,287 @@
+# Запуск из корня репозитория:
+#   python -m benchmarks.suite --scale 10k --scale 100k --output results.json
+#   python -m benchmarks.suite --scale 10k --baseline results.json   # сравнение с сохранёнными результатами
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.generators import CATEGORIES, FIRST_NAMES, LAST_NAMES, PRIORITIES, SCALES, WORDS, generate_rows, parse_scale
+from managers.numeric import numpy
+from managers.contacts import ContactsManager
+from managers.finances import FinanceManager
+from managers.notes import NotesManager
+from managers.tasks import TaskManager
+
+# Для каждой метрики: единица и какое направление лучше
+UNITS = {'s': 'lower', 'ms': 'lower', 'MB': 'lower', 'ops/s': 'higher'}
+
+# Раздел: менеджер, сохранение и операции над ним. Запросы получают менеджер и генератор случайных чисел
+WORKLOADS = {
+    'notes': {
+        'factory': NotesManager,
+        'save': 'save_notes',
+        'insert': lambda manager, rng: manager.create_note(f'{rng.choice(WORDS)} новая', ' '.join(rng.choices(WORDS, k=12))),
+        'edit': lambda manager, rng, row_id: manager.edit_note(row_id, title=f'{rng.choice(WORDS)} правка'),
+        'delete': lambda manager, row_id: manager.delete_note(row_id),
+        'queries': {
+            'search_notes': lambda manager, rng: manager.search_notes(rng.choice(WORDS), limit=50),
+            'search_notes_two_words': lambda manager, rng: manager.search_notes(' '.join(rng.sample(WORDS, 2)), limit=50),
+        },
+    },
+    'tasks': {
+        'factory': TaskManager,
+        'save': 'save_tasks',
+        'insert': lambda manager, rng: manager.add_task(f'{rng.choice(WORDS)} новая', '', rng.choice(PRIORITIES), random_date(rng)),
+        'edit': lambda manager, rng, row_id: manager.edit_task(row_id, priority=rng.choice(PRIORITIES)),
+        'delete': lambda manager, row_id: manager.delete_task(row_id),
+        'queries': {
+            'filter_tasks_status': lambda manager, rng: manager.filter_tasks(status=False, priority=rng.choice(PRIORITIES)),
+            'filter_tasks_month': lambda manager, rng: manager.filter_tasks(**month_range(rng, 'due_from', 'due_to')),
+        },
+    },
+    'contacts': {
+        'factory': ContactsManager,
+        'save': 'save_contacts',
+        'insert': lambda manager, rng: manager.add_contact(f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', f'+7{rng.randrange(10 ** 10):010d}'),
+        'edit': lambda manager, rng, row_id: manager.edit_contact(row_id, email=f'edit{row_id}@example.com'),
+        'delete': lambda manager, row_id: manager.delete_contact(row_id),
+        'queries': {
+            'search_contact_name': lambda manager, rng: manager.search_contact(f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)[:3]}', limit=20),
+            'search_contact_phone': lambda manager, rng: manager.search_contact(f'{rng.randrange(1000, 10000)}', limit=20),
+        },
+    },
+    'finances': {
+        'factory': FinanceManager,
+        'save': 'save_records',
+        'insert': lambda manager, rng: manager.add_record(f'{rng.randrange(-500000, 500001) / 100:.2f}', rng.choice(CATEGORIES), random_date(rng)),
+        'edit': lambda manager, rng, row_id: manager.edit_record(row_id, amount=f'{rng.randrange(100000) / 100:.2f}'),
+        'delete': lambda manager, row_id: manager.delete_record(row_id),
+        'queries': {
+            'filter_records_category': lambda manager, rng: manager.filter_records(category=rng.choice(CATEGORIES)),
+            'filter_records_month': lambda manager, rng: manager.filter_records(**month_range(rng, 'start_date', 'end_date')),
+            'calculate_balance': lambda manager, rng: manager.calculate_balance(),
+        },
+    },
+}
+
+
+def random_date(rng):
+    return f'{rng.randrange(1, 29):02d}-{rng.randrange(1, 13):02d}-{rng.randrange(2020, 2025)}'
+
+
+def month_range(rng, start_name, end_name):
+    month, year = rng.randrange(1, 13), rng.randrange(2020, 2025)
+    return {start_name: f'01-{month:02d}-{year}', end_name: f'28-{month:02d}-{year}'}
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def best_of(repeat, func):
+    # Лучшее из нескольких повторов меньше зависит от фоновой нагрузки
+    return min(timed(func)[0] for _ in range(repeat))
+
+
+def open_manager(kind, filename):
+    manager = WORKLOADS[kind]['factory'](filename)
+    manager.ensure_loaded()
+    return manager
+
+
+def close_manager(manager):
+    manager.storage.close()
+
+
+def load_once(kind, filename):
+    gc.collect()
+    elapsed, manager = timed(open_manager, kind, filename)
+    close_manager(manager)
+    return elapsed
+
+
+def peak_memory(kind, filename):
+    gc.collect()
+    tracemalloc.start()
+    manager = open_manager(kind, filename)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    close_manager(manager)
+    return peak / 2 ** 20
+
+
+def latencies(func, arguments):
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        func(*argument)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'mean': statistics.fmean(samples),
+        'p50': samples[len(samples) // 2],
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def throughput(func, manager, rng, min_time):
+    # Запрос повторяется, пока не наберётся min_time секунд, но не меньше трёх раз
+    count, elapsed = 0, 0.0
+    while count < 3 or elapsed < min_time:
+        started = time.perf_counter()
+        func(manager, rng)
+        elapsed += time.perf_counter() - started
+        count += 1
+    return count / elapsed
+
+
+def run_workload(kind, count, options, record):
+    workload = WORKLOADS[kind]
+    filename = f'{kind}{options.suffix}'
+    rows = generate_rows(kind, count, options.seed)
+    seeding = workload['factory'](filename)
+    seeding.storage.write_snapshot(rows)
+    close_manager(seeding)
+    del rows, seeding
+
+    # Первая загрузка строит индексы и итоги сама, следующие берут их из сохранённых метаданных
+    record('load_cold', 's', best_of(options.repeat, lambda: load_once(kind, filename)))
+    manager = open_manager(kind, filename)
+    record('save', 's', best_of(options.repeat, getattr(manager, workload['save'])))
+    close_manager(manager)
+    record('load', 's', best_of(options.repeat, lambda: load_once(kind, filename)))
+    if options.memory:
+        record('memory_peak', 'MB', peak_memory(kind, filename))
+
+    rng = random.Random(options.seed)
+    manager = open_manager(kind, filename)
+    chosen = rng.sample(range(1, count + 1), min(count, 2 * options.ops))
+    edited, deleted = chosen[:len(chosen) // 2], chosen[len(chosen) // 2:]
+    for name, value in latencies(workload['insert'], [(manager, rng)] * options.ops).items():
+        record(f'insert.{name}', 'ms', value)
+    for name, value in latencies(workload['edit'], [(manager, rng, row_id) for row_id in edited]).items():
+        record(f'edit.{name}', 'ms', value)
+    for name, value in latencies(workload['delete'], [(manager, row_id) for row_id in deleted]).items():
+        record(f'delete.{name}', 'ms', value)
+
+    for name, query in workload['queries'].items():
+        record(name, 'ops/s', throughput(query, manager, random.Random(options.seed), options.min_time))
+    if kind == 'finances':
+        report_time = best_of(options.repeat, lambda: manager.generate_report('01-01-2021', '31-12-2021'))
+        record('generate_report', 's', report_time)
+
+    csv_filename = f'{kind}.csv'
+    record('export_csv', 's', best_of(options.repeat, lambda: manager.export_to_csv(csv_filename)))
+    close_manager(manager)
+    imported = workload['factory'](f'imported_{kind}{options.suffix}')
+    record('import_csv', 's', timed(imported.import_from_csv, csv_filename)[0])
+    close_manager(imported)
+
+
+def run_suite(options):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='assistant-bench-') as workdir:
+        cwd = os.getcwd()
+        # Отчёты и CSV пишутся в текущий каталог
+        os.chdir(workdir)
+        try:
+            for scale in options.scales:
+                count = parse_scale(scale)
+                for kind in options.kinds:
+                    def record(metric, unit, value, prefix=f'{kind}.{scale}.'):
+                        results[prefix + metric] = {'value': value, 'unit': unit}
+                        print(f"{prefix + metric:48} {value:12.3f} {unit}", file=sys.stderr)
+
+                    run_workload(kind, count, options, record)
+                    for name in os.listdir(workdir):
+                        # Сегменты финансов лежат в отдельном каталоге рядом с файлом данных
+                        if os.path.isdir(name):
+                            shutil.rmtree(name)
+                        else:
+                            os.remove(name)
+        finally:
+            os.chdir(cwd)
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': numpy().__version__ if numpy() is not None else None,
+            'suffix': options.suffix,
+            'seed': options.seed,
+            'ops': options.ops,
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold):
+    # Изменение считается в сторону "хуже": положительное значение — регрессия
+    rows = []
+    for name, current in results['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None or not previous['value'] or not current['value']:
+            continue
+        ratio = current['value'] / previous['value']
+        change = ratio - 1 if UNITS[current['unit']] == 'lower' else 1 / ratio - 1
+        status = 'регрессия' if change > threshold else 'улучшение' if change < -threshold else ''
+        rows.append((name, previous['value'], current['value'], current['unit'], change, status))
+    return rows
+
+
+def print_comparison(rows):
+    print(f"{'метрика':48} {'база':>12} {'сейчас':>12}  {'хуже на':>8}")
+    for name, previous, current, unit, change, status in rows:
+        print(f"{name:48} {previous:12.3f} {current:12.3f}  {change:+8.1%} {unit} {status}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки менеджеров на синтетических данных")
+    parser.add_argument('--scale', dest='scales', action='append', help=f"размер набора: {', '.join(SCALES)} или число; можно несколько раз")
+    parser.add_argument('--kind', dest='kinds', action='append', choices=list(WORKLOADS), help="раздел; по умолчанию все")
+    parser.add_argument('--suffix', default='.json', help="расширение файла данных: .json, .bin, .msgpack, .db")
+    parser.add_argument('--ops', type=int, default=200, help="число вставок, правок и удалений для замера задержки")
+    parser.add_argument('--repeat', type=int, default=1, help="повторы загрузки, сохранения и экспорта; берётся лучший")
+    parser.add_argument('--min-time', type=float, default=0.5, help="сколько секунд повторять каждый запрос")
+    parser.add_argument('--seed', type=int, default=13)
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="не замерять пик памяти через tracemalloc")
+    parser.add_argument('--output', help="файл для результатов в JSON")
+    parser.add_argument('--baseline', help="JSON с прежними результатами для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.25, help="допустимое ухудшение, доля")
+    options = parser.parse_args(argv)
+    options.scales = options.scales or ['10k']
+    options.kinds = options.kinds or list(WORKLOADS)
+
+    results = run_suite(options)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    if options.baseline:
+        with open(options.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        for key in ('suffix', 'python', 'numpy'):
+            if baseline['meta'].get(key) != results['meta'][key]:
+                print(f"Внимание: база снята с {key}={baseline['meta'].get(key)}, сейчас {results['meta'][key]}", file=sys.stderr)
+        rows = compare(results, baseline, options.threshold)
+        print_comparison(rows)
+        # Ненулевой код выхода позволяет остановить сборку при регрессии
+        return 1 if any(status == 'регрессия' for *_, status in rows) else 0
+    json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,8 @@
+import sys
+from managers.expressions import compile_expression, DIVISION_BY_ZERO
+from managers.instrumentation import instrument
+
+@instrument
 class Calculator:
     def add(self, a, b):
         return a + b
@@ -10,37 +15,45 @@ class Calculator:
 
     def divide(self, a, b):
         if b == 0:
-            raise ValueError("Ошибка: деление на ноль невозможно.")
+            raise ValueError(DIVISION_BY_ZERO)
         return a / b
 
-    def calculate(self, expression):
+    def evaluate(self, expression, variables=None):
+        # Разобранные выражения кэшируются, повторный расчёт с другими переменными не разбирает текст заново
+        return compile_expression(expression.strip()).evaluate(variables)
+
+    def evaluate_many(self, expression, columns):
+        # Одно выражение по колонкам значений: векторно через NumPy или скомпилированным циклом
+        return compile_expression(expression.strip()).evaluate_many(columns)
+
+    def calculate(self, expression, variables=None):
         try:
-            parts = expression.split()
-            if len(parts) != 3:
-                raise ValueError("Ошибка: выражение должно содержать два числа и оператор.")
-            
-            a = float(parts[0])
-            operator = parts[1]
-            b = float(parts[2])
-
-            if operator == '+':
-                return self.add(a, b)
-            elif operator == '-':
-                return self.subtract(a, b)
-            elif operator == '*':
-                return self.multiply(a, b)
-            elif operator == '/':
-                return self.divide(a, b)
-            else:
-                raise ValueError("Ошибка: неподдерживаемый оператор. Используйте +, -, * или /.")
-        
+            return self.evaluate(expression, variables)
         except ValueError as e:
             return str(e)
         except Exception as e:
             return "Ошибка: " + str(e)
 
+    def calculate_lines(self, lines, variables=None):
+        for line in lines:
+            if line.strip():
+                yield self.calculate(line, variables)
+
+def calculate_stream(calculator, source, output):
+    # Результаты пишутся по мере чтения, файл выражений целиком в память не загружается
+    for result in calculator.calculate_lines(source):
+        output.write(f"{result}\n")
+
 def calculate(calculator: Calculator) -> None:
-    expression = input("Введите выражение (например, \"2 + 2\"): ")
+    expression = input("Введите выражение (например, \"(2 + 2) * sqrt(9)\"): ")
     result = calculator.calculate(expression)
     if result is not None:
         print(result)
+
+if __name__ == "__main__":
+    # python -m managers.calc [файл] — пересчёт выражений построчно из файла или stdin
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r') as source:
+            calculate_stream(Calculator(), source, sys.stdout)
+    else:
+        calculate_stream(Calculator(), sys.stdin, sys.stdout)
@@ -0,0 +1,219 @@
+import argparse
+import json
+import re
+import shlex
+import sys
+from contextlib import ExitStack
+
+from managers.csvio import format_import_stats
+from managers.instrumentation import enable, profiled
+from managers.server import AssistantService
+
+
+# Слово командной строки и его части: обычный текст, экранированный символ, строка в одинарных и двойных кавычках
+WORD_RE = re.compile(r'''(?:[^\s'"\\]+|\\.|'[^']*'|"(?:[^"\\]|\\.)*")+''')
+PART_RE = re.compile(r'''([^\s'"\\]+)|\\(.)|'([^']*)'|"((?:[^"\\]|\\.)*)"''')
+DOUBLE_QUOTED_ESCAPE_RE = re.compile(r'\\([\\"])')
+
+
+def split_command(line):
+    # shlex.split на десятках тысяч строк медленнее самих команд; разбор регулярными выражениями
+    # даёт тот же результат для кавычек и экранирования, а всё необычное отдаётся shlex
+    if WORD_RE.sub('', line).strip():
+        return shlex.split(line)
+    return [PART_RE.sub(unquote, word) for word in WORD_RE.findall(line)]
+
+
+def unquote(match):
+    plain, escaped, single, double = match.groups()
+    if double is not None:
+        return DOUBLE_QUOTED_ESCAPE_RE.sub(r'\1', double)
+    return plain or escaped or single or ''
+
+
+class CommandParser(argparse.ArgumentParser):
+    # В пакетном режиме ошибка в строке не должна завершать весь процесс
+    def error(self, message):
+        raise ValueError(f"Ошибка: {message}")
+
+
+def parse_status(value):
+    statuses = {'done': True, 'выполнена': True, 'open': False, 'не выполнена': False}
+    if value.lower() not in statuses:
+        raise argparse.ArgumentTypeError("статус должен быть done или open")
+    return statuses[value.lower()]
+
+
+def parse_variable(value):
+    name, separator, number = value.partition('=')
+    if not separator:
+        raise argparse.ArgumentTypeError("переменная задаётся как имя=значение")
+    return name.strip(), float(number)
+
+
+def add_section(parser, sections, name, help):
+    actions = sections.add_parser(name, help=help).add_subparsers(dest='action', required=True)
+
+    def command(action, method, *arguments):
+        # Имена аргументов совпадают с параметрами метода менеджера
+        leaf = actions.add_parser(action)
+        params = [leaf.add_argument(*flags, **options).dest for flags, options in arguments]
+        leaf.set_defaults(section=name, method=method, params=params)
+        parser.commands[name, action] = leaf
+
+    return command
+
+
+def build_parser():
+    parser = CommandParser(prog='personal_assistant.py', description="Персональный помощник без интерактивного меню")
+    parser.add_argument('--data-dir', default='.', help="каталог с файлами менеджеров")
+    parser.add_argument('--stats', metavar='FILE', help="записать замеры методов менеджеров в JSON-файл")
+    parser.add_argument('--profile', metavar='DIR', help="сохранить профиль cProfile запуска в каталог")
+    parser.commands = {}
+    sections = parser.add_subparsers(dest='section', required=True)
+    compression = (['--compression'], {'choices': ['gzip', 'xz']})
+    on_conflict = (['--on-conflict'], {'choices': ['renumber', 'skip', 'replace']})
+
+    notes = add_section(parser, sections, 'notes', "заметки")
+    notes('add', 'create_note', (['title'], {}), (['--content'], {'default': ''}))
+    notes('list', 'view_notes')
+    notes('show', 'view_note_details', (['note_id'], {'type': int}))
+    notes('edit', 'edit_note', (['note_id'], {'type': int}), (['--title'], {}), (['--content'], {}))
+    notes('delete', 'delete_note', (['note_id'], {'type': int}))
+    notes('search', 'search_notes', (['query'], {}), (['--limit'], {'type': int}))
+    notes('export', 'export_to_csv', (['csv_filename'], {}), compression)
+    notes('import', 'import_from_csv', (['csv_filename'], {}), on_conflict)
+
+    tasks = add_section(parser, sections, 'tasks', "задачи")
+    tasks('add', 'add_task', (['title'], {}), (['--description'], {'default': ''}), (['--priority'], {}), (['--due', '--due-date'], {'dest': 'due_date'}))
+    tasks(
+        'list', 'filter_tasks', (['--status'], {'type': parse_status}), (['--priority'], {}),
+        (['--due', '--due-date'], {'dest': 'due_date'}), (['--from'], {'dest': 'due_from'}), (['--to'], {'dest': 'due_to'}),
+    )
+    tasks('done', 'mark_task_done', (['task_id'], {'type': int}))
+    tasks(
+        'edit', 'edit_task', (['task_id'], {'type': int}), (['--title'], {}), (['--description'], {}),
+        (['--priority'], {}), (['--due', '--due-date'], {'dest': 'due_date'}),
+    )
+    tasks('delete', 'delete_task', (['task_id'], {'type': int}))
+    tasks('export', 'export_to_csv', (['csv_filename'], {}), compression)
+    tasks('import', 'import_from_csv', (['csv_filename'], {}), on_conflict)
+
+    contacts = add_section(parser, sections, 'contacts', "контакты")
+    contacts('add', 'add_contact', (['name'], {}), (['--phone'], {}), (['--email'], {}))
+    contacts('search', 'search_contact', (['query'], {}), (['--limit'], {'type': int}))
+    contacts('edit', 'edit_contact', (['contact_id'], {'type': int}), (['--name'], {}), (['--phone'], {}), (['--email'], {}))
+    contacts('delete', 'delete_contact', (['contact_id'], {'type': int}))
+    contacts('export', 'export_to_csv', (['csv_filename'], {}), compression)
+    contacts('import', 'import_from_csv', (['csv_filename'], {}), on_conflict)
+
+    finance = add_section(parser, sections, 'finance', "финансы")
+    finance('add', 'add_record', (['amount'], {}), (['category'], {}), (['date'], {}), (['--description'], {'default': ''}))
+    finance(
+        'edit', 'edit_record', (['record_id'], {'type': int}), (['--amount'], {}), (['--category'], {}),
+        (['--date'], {}), (['--description'], {}),
+    )
+    finance('delete', 'delete_record', (['record_id'], {'type': int}))
+    finance('list', 'filter_records', (['--category'], {}), (['--from'], {'dest': 'start_date'}), (['--to'], {'dest': 'end_date'}))
+    finance(
+        'report', 'generate_report', (['start_date'], {}), (['end_date'], {}),
+        (['--columns'], {'type': lambda value: value.split(',')}), compression,
+        (['--no-records'], {'dest': 'include_records', 'action': 'store_false'}),
+    )
+    finance(
+        'reports', 'generate_reports', (['--year'], {'type': int}), (['--partition'], {'choices': ['month', 'category']}),
+        (['--workers'], {'type': int}), (['--columns'], {'type': lambda value: value.split(',')}), compression,
+    )
+    finance('balance', 'calculate_balance')
+    finance('by-category', 'group_by_category')
+    finance('by-month', 'group_by_month')
+    finance('export', 'export_to_csv', (['csv_filename'], {}), compression)
+    finance('import', 'import_from_csv', (['csv_filename'], {}), on_conflict)
+
+    calc = sections.add_parser('calc', help="калькулятор")
+    calc.add_argument('expression')
+    calc.add_argument('--var', dest='variables', type=parse_variable, action='append', help="значение переменной: имя=число")
+    calc.set_defaults(section='calc', method='evaluate', params=['expression', 'variables'])
+    parser.commands['calc',] = calc
+
+    batch = sections.add_parser('batch', help="выполнить файл команд одной транзакцией")
+    batch.add_argument('filename', help="файл с командами, по одной на строку; - для stdin")
+    batch.add_argument('--keep-going', action='store_true', help="пропускать ошибочные строки вместо отката")
+    return parser
+
+
+def parse_command(parser, words):
+    # Строка пакета разбирается сразу парсером конечной команды, минуя два уровня подкоманд
+    for size in (2, 1):
+        leaf = parser.commands.get(tuple(words[:size]))
+        if leaf is not None:
+            return leaf.parse_args(words[size:])
+    return parser.parse_args(words)
+
+
+SECTION_NAMES = {'finance': 'finances'}
+
+
+def prepare(options):
+    section = SECTION_NAMES.get(options.section, options.section)
+    kwargs = {name: getattr(options, name) for name in options.params if getattr(options, name) is not None}
+    if section == 'calc' and 'variables' in kwargs:
+        kwargs['variables'] = dict(kwargs['variables'])
+    return section, options.method, kwargs
+
+
+def show(service, method, result, output):
+    if result is None:
+        return
+    if method == 'import_from_csv':
+        print(format_import_stats(result), file=output)
+        return
+    print(json.dumps(result, ensure_ascii=False, default=service.default), file=output)
+
+
+def run_batch(service, parser, lines, keep_going=False, output=sys.stdout):
+    # Каждый менеджер входит в транзакцию при первом обращении: одна блокировка и один сброс на диск.
+    # Ошибка откатывает все изменения файла команд, если не задан --keep-going
+    failures = 0
+    with ExitStack() as transactions:
+        opened = set()
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                options = parse_command(parser, split_command(line))
+                if options.section == 'batch':
+                    raise ValueError("Ошибка: вложенный batch не поддерживается.")
+                section, method, kwargs = prepare(options)
+                manager = service.manager(section)
+                if section not in opened and hasattr(manager, 'transaction'):
+                    transactions.enter_context(manager.transaction())
+                    opened.add(section)
+                show(service, method, getattr(manager, method)(**kwargs), output)
+            except Exception as error:
+                if not keep_going:
+                    raise ValueError(f"Строка {number}: {error}") from error
+                failures += 1
+                print(f"Строка {number}: {error}", file=sys.stderr)
+    return failures
+
+
+def main(argv=None):
+    parser = build_parser()
+    try:
+        options = parser.parse_args(argv)
+        if options.stats:
+            enable(options.stats)
+        with profiled(options.profile):
+            service = AssistantService(options.data_dir, commit_window=0.0)
+            if options.section == 'batch':
+                source = sys.stdin if options.filename == '-' else open(options.filename, 'r', encoding='utf-8')
+                with source:
+                    return 1 if run_batch(service, parser, source, options.keep_going) else 0
+            section, method, kwargs = prepare(options)
+            show(service, method, service.call(section, method, (), kwargs), sys.stdout)
+            return 0
+    except (ValueError, OSError) as error:
+        print(error, file=sys.stderr)
+        return 1
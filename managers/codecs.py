@@ -0,0 +1,177 @@
+import json
+import marshal
+import os
+import struct
+from array import array
+from functools import partial
+from itertools import accumulate, repeat
+from json.encoder import JSONEncoder, c_make_encoder, encode_basestring_ascii
+from operator import itemgetter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+SIZE = struct.Struct('<I')
+# Исключения, которыми разные форматы сообщают о повреждённом файле
+DECODE_ERRORS = (ValueError, EOFError, TypeError, KeyError, IndexError, struct.error)
+
+
+def make_row_encoder():
+    if c_make_encoder is None:
+        return lambda row: json.dumps(row).encode()
+    # json.dumps на каждую запись заново собирает кодировщик, здесь он создаётся один раз
+    encoder = c_make_encoder(None, JSONEncoder().default, encode_basestring_ascii, None, ': ', ', ', False, False, True)
+    return lambda row: ''.join(encoder(row, 0)).encode()
+
+
+class JsonCodec:
+    # Одна запись на строку: файл остаётся JSON-массивом, но строку можно прочитать по смещению
+    magic = b'[\n'
+
+    def __init__(self, name='json', dumps=None, loads=json.loads):
+        self.name = name
+        self.dumps = dumps or make_row_encoder()
+        self.loads = loads
+
+    def write(self, file, rows, fields):
+        lines = list(map(self.dumps, rows))
+        offsets = array('q', accumulate((len(line) + 2 for line in lines[:-1]), initial=2))
+        file.write(b'[\n' + b',\n'.join(lines) + b'\n]\n' if lines else b'[\n]\n')
+        return array('q', [row['id'] for row in rows]), offsets
+
+    def load(self, data):
+        return self.loads(data)
+
+    def header(self, data):
+        # Снимок старого формата целиком в одну строку не поддерживает чтение по смещению
+        return (None, 2) if data[:2] == self.magic else None
+
+    def row_at(self, data, offset, fields):
+        return self.loads(data[offset:data.find(b'\n', offset)].rstrip(b','))
+
+    def rows(self, data, fields, position):
+        while True:
+            end = data.find(b'\n', position)
+            line = data[position:end]
+            if end < 0 or line == b']':
+                return
+            yield position, self.loads(line.rstrip(b','))
+            position = end + 1
+
+
+def marshal_row(data, offset):
+    # marshal.loads игнорирует байты после объекта, поэтому срез до конца файла не копируется
+    with memoryview(data) as view, view[offset:] as tail:
+        return marshal.loads(tail)
+
+
+def msgpack_array_header(count):
+    if count < 16:
+        return bytes([0x90 | count])
+    if count < 2 ** 16:
+        return b'\xdc' + struct.pack('>H', count)
+    return b'\xdd' + struct.pack('>I', count)
+
+
+def msgpack_row(data, offset, chunk=256):
+    unpacker = msgpack.Unpacker(use_list=False)
+    while offset < len(data):
+        unpacker.feed(data[offset:offset + chunk])
+        offset += chunk
+        try:
+            return unpacker.unpack()
+        except msgpack.OutOfData:
+            chunk *= 2
+    raise ValueError("Ошибка: запись обрывается на конце файла.")
+
+
+class RecordCodec:
+    # Заголовок со списком полей, затем один массив кортежей без повторения ключей.
+    # Массив собирается из отдельно упакованных записей, поэтому каждую можно прочитать по смещению
+    def __init__(self, name, magic, pack, unpack, array_header, unpack_row):
+        self.name = name
+        self.magic = magic
+        self.pack = pack
+        self.unpack = unpack
+        self.array_header = array_header
+        self.unpack_row = unpack_row
+
+    def write(self, file, rows, fields):
+        header = self.pack(list(fields))
+        values = itemgetter(*fields)
+        parts = []
+        for row in rows:
+            try:
+                parts.append(self.pack(values(row)))
+            except KeyError:
+                # В старых файлах у записей могло не быть части полей
+                parts.append(self.pack(tuple(map(row.get, fields))))
+        head = self.magic + SIZE.pack(len(header)) + header + self.array_header(len(parts))
+        offsets = array('q', accumulate(map(len, parts[:-1]), initial=len(head)))
+        file.write(head + b''.join(parts))
+        return array('q', [row['id'] for row in rows]), offsets
+
+    def load(self, data):
+        fields, position = self.header(data)
+        with memoryview(data) as view, view[position:] as body:
+            values = self.unpack(body)
+        return list(map(dict, map(zip, repeat(fields), values)))
+
+    def header(self, data):
+        start = len(self.magic) + SIZE.size
+        size, = SIZE.unpack_from(data, len(self.magic))
+        return list(self.unpack(data[start:start + size])), start + size
+
+    def row_at(self, data, offset, fields):
+        return dict(zip(fields, self.unpack_row(data, offset)))
+
+    def rows(self, data, fields, position):
+        with memoryview(data) as view, view[position:] as body:
+            values = self.unpack(body)
+        position += len(self.array_header(len(values)))
+        for value in values:
+            yield position, dict(zip(fields, value))
+            # Упаковка детерминирована, длину записи можно получить повторной упаковкой
+            position += len(self.pack(value))
+
+
+CODECS = {
+    'json': JsonCodec(),
+    # Версия 2 без ссылок между объектами: упакованный список равен склейке упакованных записей
+    'binary': RecordCodec(
+        'binary', b'PAB1', lambda value: marshal.dumps(value, 2), marshal.loads,
+        lambda count: b'[' + struct.pack('<i', count), marshal_row,
+    ),
+}
+if orjson is not None:
+    CODECS['orjson'] = JsonCodec('orjson', orjson.dumps, orjson.loads)
+if msgpack is not None:
+    CODECS['msgpack'] = RecordCodec(
+        'msgpack', b'PAM1', msgpack.packb, partial(msgpack.unpackb, use_list=False),
+        msgpack_array_header, msgpack_row,
+    )
+
+EXTENSIONS = {'.bin': 'binary', '.msgpack': 'msgpack'}
+MAGICS = {b'PAB1': 'binary', b'PAM1': 'msgpack'}
+
+
+def codec_for(filename, name=None):
+    if name is None:
+        name = EXTENSIONS.get(os.path.splitext(filename)[1], 'orjson' if orjson is not None else 'json')
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(f"Ошибка: формат {name} недоступен. Доступные форматы: {', '.join(CODECS)}.")
+    return codec
+
+
+def detect_codec(data):
+    # Формат определяется по содержимому, поэтому файл читается при любом расширении
+    name = MAGICS.get(bytes(data[:4]))
+    return CODECS['json'] if name is None else codec_for('', name)
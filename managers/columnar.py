@@ -0,0 +1,108 @@
+from array import array
+
+from managers.indexes import INVALID_DAY
+from managers.money import MINOR_UNITS
+
+from managers.numeric import numpy
+
+
+class FinanceColumns:
+    def __init__(self, records=()):
+        self.ids = array('q')
+        # Суммы в копейках: int64 складывается точно и в NumPy, и без него
+        self.amounts = array('q')
+        self.days = array('i')
+        self.codes = array('i')
+        self.categories = []
+        self.category_codes = {}
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, record):
+        code = self.category_codes.get(record.category)
+        if code is None:
+            code = self.category_codes[record.category] = len(self.categories)
+            self.categories.append(record.category)
+        self.ids.append(record.id)
+        self.amounts.append(record.cents)
+        self.days.append(record.day)
+        self.codes.append(code)
+
+    def totals(self, start_day=None, end_day=None):
+        np = numpy()
+        if np is not None:
+            amounts = self._vector(self.amounts, np.int64)
+            mask = self._mask(start_day, end_day)
+            if mask is not None:
+                amounts = amounts[mask]
+            return int(amounts[amounts > 0].sum()), int(amounts[amounts < 0].sum())
+        amounts = self.amounts
+        if start_day is not None or end_day is not None:
+            low, high = self._bounds(start_day, end_day)
+            amounts = [amount for amount, day in zip(self.amounts, self.days) if low <= day <= high]
+        # filter со встроенным сравнением работает без цикла на Python
+        return sum(filter((0).__lt__, amounts)), sum(filter((0).__gt__, amounts))
+
+    def by_category(self, start_day=None, end_day=None):
+        np = numpy()
+        if np is not None:
+            amounts = self._vector(self.amounts, np.int64)
+            codes = self._vector(self.codes, np.int32)
+            mask = self._mask(start_day, end_day)
+            if mask is not None:
+                amounts, codes = amounts[mask], codes[mask]
+            # bincount с весами считает во float64, add.at складывает целые без округления
+            sums = np.zeros(len(self.categories), dtype=np.int64)
+            np.add.at(sums, codes, amounts)
+            present = np.bincount(codes, minlength=len(self.categories))
+            return {self.categories[code]: int(sums[code]) for code in np.flatnonzero(present)}
+        sums = [0] * len(self.categories)
+        present = [False] * len(self.categories)
+        rows = zip(self.amounts, self.codes)
+        if start_day is not None or end_day is not None:
+            low, high = self._bounds(start_day, end_day)
+            rows = (row for row, day in zip(rows, self.days) if low <= day <= high)
+        for amount, code in rows:
+            sums[code] += amount
+            present[code] = True
+        return {name: total for name, total, seen in zip(self.categories, sums, present) if seen}
+
+    def currency_amounts(self):
+        # Для выражений суммы переводятся в рубли
+        np = numpy()
+        if np is not None:
+            return self._vector(self.amounts, np.int64) / MINOR_UNITS
+        return [amount / MINOR_UNITS for amount in self.amounts]
+
+    def select(self, start_day=None, end_day=None):
+        np = numpy()
+        if np is not None:
+            ids = self._vector(self.ids, np.int64)
+            mask = self._mask(start_day, end_day)
+            return (ids if mask is None else ids[mask]).tolist()
+        if start_day is None and end_day is None:
+            return self.ids.tolist()
+        low, high = self._bounds(start_day, end_day)
+        return [record_id for record_id, day in zip(self.ids, self.days) if low <= day <= high]
+
+    @staticmethod
+    def _vector(column, dtype):
+        # Массив array без копирования отображается в ndarray
+        np = numpy()
+        return np.frombuffer(column, dtype=dtype) if len(column) else np.zeros(0, dtype=dtype)
+
+    @staticmethod
+    def _bounds(start_day, end_day):
+        low = INVALID_DAY + 1 if start_day is None else start_day
+        high = 2 ** 31 - 1 if end_day is None else end_day
+        return low, high
+
+    def _mask(self, start_day, end_day):
+        if start_day is None and end_day is None:
+            return None
+        low, high = self._bounds(start_day, end_day)
+        days = self._vector(self.days, numpy().int32)
+        return (days >= low) & (days <= high)
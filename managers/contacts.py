@@ -1,26 +1,60 @@
-import json
-import csv
+import re
+from itertools import islice
 import texts
+from managers.storage import LazyManager, ConflictError, open_store, index_by_id, resolve_id
+from managers.csvio import stream_import, optional_int, format_import_stats, select_columns, row_getter, write_csv
+from managers.indexes import NgramIndex, PrefixTrie, tokenize
+from managers.instrumentation import instrument
+from managers.querycache import cached_query
+
+FIELDS = ['id', 'name', 'phone', 'email']
+INDEXES = {'name': 'unicode_lower(name)', 'phone': 'phone'}
+
+def phone_digits(value):
+    return re.sub(r'\D', '', value or '')
 
 class Contact:
+    __slots__ = ('id', 'name', 'phone', 'email')
+
     def __init__(self, name, phone=None, email=None):
         self.id = None
         self.name = name
         self.phone = phone
         self.email = email
 
-class ContactsManager:
-    def __init__(self, filename='contacts.json'):
+@instrument
+class ContactsManager(LazyManager):
+    lazy_fields = ('contacts', 'name_index', 'phone_index')
+
+    def __init__(self, filename='contacts.json', commit_window=0.0, codec=None):
         self.filename = filename
+        self.storage = open_store(filename, self.contact_rows, 'contacts', FIELDS, INDEXES, commit_window, codec=codec)
+
+    def load(self):
         self.contacts = self.load_contacts()
+        self.build_search_indexes()
 
     def load_contacts(self):
-        try:
-            with open(self.filename, 'r') as file:
-                contacts_data = json.load(file)
-                return [self.dict_to_contact(contact) for contact in contacts_data]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        contacts, renumbered = index_by_id(map(self.dict_to_contact, self.storage.load()), self.storage)
+        if renumbered:
+            self.storage.write_snapshot([self.contact_to_dict(contact) for contact in contacts.values()])
+        return contacts
+
+    def build_search_indexes(self):
+        self.name_index = PrefixTrie()
+        self.phone_index = NgramIndex()
+        for contact in self.contacts.values():
+            self.index_contact(contact)
+
+    def index_contact(self, contact):
+        for word in set(tokenize(contact.name)):
+            self.name_index.add(word, contact.id)
+        self.phone_index.add(contact.id, phone_digits(contact.phone))
+
+    def unindex_contact(self, contact):
+        for word in set(tokenize(contact.name)):
+            self.name_index.remove(word, contact.id)
+        self.phone_index.remove(contact.id)
 
     def dict_to_contact(self, contact_dict):
         contact = Contact(contact_dict['name'], contact_dict.get('phone'), contact_dict.get('email'))
@@ -28,8 +62,11 @@ class ContactsManager:
         return contact
 
     def save_contacts(self):
-        with open(self.filename, 'w') as file:
-            json.dump([self.contact_to_dict(contact) for contact in self.contacts], file)
+        with self.mutation():
+            self.storage.compact()
+
+    def contact_rows(self):
+        return [self.contact_to_dict(contact) for contact in self.contacts.values()]
 
     def contact_to_dict(self, contact):
         return {
@@ -39,60 +76,117 @@ class ContactsManager:
             'email': contact.email
         }
 
+    def current_row(self, contact_id):
+        if not self.loaded:
+            return self.storage.get(contact_id)
+        contact = self.contacts.get(contact_id)
+        return self.contact_to_dict(contact) if contact else None
+
+    def apply_row(self, contact_id, row):
+        old_contact = self.contacts.pop(contact_id, None) if row is None else self.contacts.get(contact_id)
+        if old_contact:
+            self.unindex_contact(old_contact)
+        if row is not None:
+            contact = self.contacts[contact_id] = self.dict_to_contact(row)
+            self.index_contact(contact)
+
     def get_next_id(self):
-        if not self.contacts:
-            return 1
-        return max(contact.id for contact in self.contacts) + 1
+        self.ensure_loaded()
+        return self.storage.next_id
 
     def add_contact(self, name, phone=None, email=None):
-        new_contact = Contact(name, phone, email)
-        new_contact.id = self.get_next_id()  # Получаем следующий ID
-        self.contacts.append(new_contact)
-        self.save_contacts()
-
-    def search_contact(self, query):
-        return [contact for contact in self.contacts if query.lower() in contact.name.lower() or (contact.phone and query in contact.phone)]
-
-    def edit_contact(self, contact_id, name=None, phone=None, email=None):
-        contact = self.get_contact_by_id(contact_id)
-        if contact:
-            if name:
-                contact.name = name
-            if phone:
-                contact.phone = phone
-            if email:
-                contact.email = email
-            self.save_contacts()
+        with self.mutation():
+            new_contact = Contact(name, phone, email)
+            new_contact.id = self.get_next_id()  # Получаем следующий ID
+            self.contacts[new_contact.id] = new_contact
+            self.index_contact(new_contact)
+            self.storage.insert(self.contact_to_dict(new_contact))
+
+    @cached_query()
+    def search_contact(self, query, limit=None):
+        words = tokenize(query)
+        digits = phone_digits(query)
+        if not words and not digits:
+            # Пустой запрос показывает всю книгу, запрос из одних знаков вроде «@» или «+» не находит ничего
+            return [] if (query or '').strip() else list(islice(self.contacts.values(), limit))
+        found = {}
+        if words:
+            # Ищем по самому длинному слову, остальные проверяем у кандидатов
+            longest = max(words, key=len)
+            others = [word for word in words if word != longest]
+            for contact_id in self.name_index.search(longest, None if others else limit):
+                contact = self.contacts[contact_id]
+                if others:
+                    name_words = tokenize(contact.name)
+                    if not all(any(name_word.startswith(word) for name_word in name_words) for word in others):
+                        continue
+                found[contact_id] = contact
+                if limit is not None and len(found) >= limit:
+                    return list(found.values())
+        if digits:
+            for contact_id in self.phone_index.search(digits, limit):
+                found.setdefault(contact_id, self.contacts[contact_id])
+        return list(islice(found.values(), limit))
+
+    def edit_contact(self, contact_id, name=None, phone=None, email=None, expected=None):
+        with self.mutation(contact_id, expected):
+            contact = self.contacts.get(contact_id)
+            if contact:
+                self.unindex_contact(contact)
+                if name:
+                    contact.name = name
+                if phone:
+                    contact.phone = phone
+                if email:
+                    contact.email = email
+                self.index_contact(contact)
+                self.storage.update(self.contact_to_dict(contact))
 
     def delete_contact(self, contact_id):
-        self.contacts = [contact for contact in self.contacts if contact.id != contact_id]
-        self.save_contacts()
+        with self.mutation():
+            contact = self.contacts.pop(contact_id, None)
+            if contact:
+                self.unindex_contact(contact)
+                self.storage.delete(contact_id)
 
     def get_contact_by_id(self, contact_id):
-        for contact in self.contacts:
-            if contact.id == contact_id:
-                return contact
-        return None
-
-    def export_to_csv(self, csv_filename='contacts.csv'):
-        with open(csv_filename, 'w', newline='') as csvfile:
-            fieldnames = ['id', 'name', 'phone', 'email']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            writer.writeheader()
-            for contact in self.contacts:
-                writer.writerow(self.contact_to_dict(contact))
-
-    def import_from_csv(self, csv_filename='contacts.csv'):
-        with open(csv_filename, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                contact = Contact(row['name'], row.get('phone'), row.get('email'))
-                contact.id = int(row['id'])
-                self.contacts.append(contact)
-            self.save_contacts()
+        if self.loaded:
+            return self.contacts.get(contact_id)
+        row = self.storage.get(contact_id)
+        return self.dict_to_contact(row) if row else None
+
+    def iter_contact_rows(self, columns=FIELDS):
+        contacts = self.contacts.values() if self.loaded else map(self.dict_to_contact, self.storage.iter_rows())
+        return map(row_getter(columns), contacts)
+
+    def export_to_csv(self, csv_filename='contacts.csv', columns=None, compression=None):
+        columns = select_columns(FIELDS, columns)
+        write_csv(csv_filename, columns, self.iter_contact_rows(columns), compression)
+
+    def import_from_csv(self, csv_filename='contacts.csv', batch_size=10000, on_conflict='renumber', progress=None):
+        return stream_import(csv_filename, self.csv_to_contact, lambda contact: self.import_contact(contact, on_conflict), self.mutation, batch_size, progress)
+
+    def csv_to_contact(self, row):
+        contact = Contact(row['name'], row.get('phone') or None, row.get('email') or None)
+        contact.id = optional_int(row.get('id'))
+        return contact
+
+    def import_contact(self, contact, on_conflict='renumber'):
+        status = resolve_id(self.contacts, contact, self.storage, on_conflict)
+        if status == 'skipped':
+            return status
+        if status == 'replaced':
+            self.unindex_contact(self.contacts[contact.id])
+            self.contacts[contact.id] = contact
+            self.index_contact(contact)
+            self.storage.update(self.contact_to_dict(contact))
+        else:
+            self.index_contact(contact)
+            self.storage.insert(self.contact_to_dict(contact))
+        return status
 
 def manage_contacts(contacts_manager: ContactsManager) -> None:
+    contacts_manager.sync()
     print(texts.CONTACTS)
     action = input("Выберите действие: ")
     if action == '1':
@@ -111,10 +205,14 @@ def manage_contacts(contacts_manager: ContactsManager) -> None:
             print("Контакты не найдены.")
     elif action == '3':
         contact_id = int(input("Введите id контакта: "))
+        version = contacts_manager.version(contact_id)
         name = input("Введите имя контакта: ")
         phone = input("Введите номер телефона: ")
         email = input("Введите email: ")
-        contacts_manager.edit_contact(contact_id, name, phone, email)
+        try:
+            contacts_manager.edit_contact(contact_id, name, phone, email, expected=version)
+        except ConflictError as error:
+            print(error)
     elif action == '4':
         contact_id = int(input("Введите id контакта: "))
         contacts_manager.delete_contact(contact_id)
@@ -123,4 +221,4 @@ def manage_contacts(contacts_manager: ContactsManager) -> None:
         contacts_manager.export_to_csv(filename)
     elif action == '6':
         filename = input("Введите имя файла: ")
-        contacts_manager.import_from_csv(filename)
+        print(format_import_stats(contacts_manager.import_from_csv(filename)))
@@ -0,0 +1,125 @@
+import csv
+import gzip
+import io
+import lzma
+import os
+from collections import Counter
+from contextlib import contextmanager
+from itertools import islice
+from operator import attrgetter
+
+TRUE_VALUES = {'true', '1', 'yes', 'y', 'да'}
+BUFFER_SIZE = 1 << 20
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'xz': '.xz'}
+STATUS_LABELS = {
+    'imported': 'добавлено',
+    'renumbered': 'добавлено с новым id',
+    'replaced': 'заменено',
+    'skipped': 'пропущено',
+    'invalid': 'с ошибками',
+}
+
+
+def parse_bool(value):
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def optional_int(value):
+    return int(value) if value not in (None, '') else None
+
+
+def format_import_stats(stats):
+    return ', '.join(f"{label}: {stats[status]}" for status, label in STATUS_LABELS.items() if stats.get(status)) or 'нет записей'
+
+
+def select_columns(fields, columns=None):
+    if not columns:
+        return list(fields)
+    unknown = [column for column in columns if column not in fields]
+    if unknown:
+        raise ValueError(f"Ошибка: неизвестные столбцы: {', '.join(unknown)}.")
+    return list(columns)
+
+
+def row_getter(columns):
+    getter = attrgetter(*columns)
+    if len(columns) == 1:
+        return lambda record: (getter(record),)
+    return getter
+
+
+def compression_for(filename, compression=None):
+    if compression is None:
+        for name, suffix in COMPRESSION_SUFFIXES.items():
+            if filename.endswith(suffix):
+                return name
+        return None
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError("Ошибка: поддерживается только сжатие gzip или xz.")
+    return compression
+
+
+@contextmanager
+def open_csv(filename, mode='r', compression=None):
+    compression = compression_for(filename, compression)
+    with open(filename, mode + 'b', buffering=BUFFER_SIZE) as raw:
+        stream = raw
+        if compression == 'gzip':
+            stream = gzip.GzipFile(fileobj=raw, mode=mode + 'b')
+        elif compression == 'xz':
+            stream = lzma.LZMAFile(raw, mode + 'b')
+        csvfile = io.TextIOWrapper(stream, newline='')
+        try:
+            yield csvfile, raw
+        finally:
+            csvfile.close()
+
+
+def write_csv(csv_filename, header, rows, compression=None):
+    with open_csv(csv_filename, 'w', compression) as (csvfile, _):
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def read_batches(csv_filename, batch_size=10000, progress=None):
+    total = os.path.getsize(csv_filename) or 1
+    with open_csv(csv_filename) as (csvfile, raw):
+        reader = csv.DictReader(csvfile)
+        done = 0
+        while True:
+            batch = list(islice(reader, batch_size))
+            if not batch:
+                return
+            yield batch
+            done += len(batch)
+            if progress is not None:
+                progress(done, min(raw.tell() / total, 1.0))
+
+
+def stream_import(csv_filename, convert, apply, mutation, batch_size=10000, progress=None, finish=None):
+    # mutation() — контекст одной пачки, обычно mutation() менеджера: блокировка и синхронизация
+    # берутся на пачку, поэтому журнал пишется на диск по мере импорта, а не в самом конце.
+    # finish(records) получает добавленные записи пачки до снятия блокировки; если id повторяется
+    # в пачке (on_conflict='replace'), передаётся только последняя запись с этим id
+    stats = Counter()
+    for batch in read_batches(csv_filename, batch_size, progress):
+        records = []
+        for row in batch:
+            try:
+                records.append(convert(row))
+            except (KeyError, TypeError, ValueError):
+                stats['invalid'] += 1
+        # Одна запись журнала на диск на всю пачку
+        with mutation():
+            applied = {}
+            for record in records:
+                status = apply(record)
+                stats[status] += 1
+                if status != 'skipped':
+                    # Заменённая запись этой же пачки ещё не попала в индексы и удаляется только отсюда
+                    applied.pop(record.id, None)
+                    applied[record.id] = record
+            if finish is not None:
+                finish(list(applied.values()))
+    return dict(stats)
@@ -0,0 +1,328 @@
+import ast
+import math
+import re
+from functools import lru_cache, reduce
+from numbers import Number
+
+from managers.numeric import numpy
+
+TOKEN_RE = re.compile(r'\s*(?:(\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)|([^\W\d]\w*)|(\*\*|//|[-+*/%(),]))')
+BINARY = {
+    '+': (1, ast.Add),
+    '-': (1, ast.Sub),
+    '*': (2, ast.Mult),
+    '/': (2, ast.Div),
+    '//': (2, ast.FloorDiv),
+    '%': (2, ast.Mod),
+}
+UNARY = {'-': ast.USub, '+': ast.UAdd}
+
+
+def power(base, exponent):
+    # Целые числа возводятся в степень как float: Python иначе считал бы сколь угодно длинное целое,
+    # а переполнение float даёт OverflowError и понятную ошибку
+    result = float(base) ** exponent if isinstance(base, int) and isinstance(exponent, int) else base ** exponent
+    # Отрицательное основание в дробной степени даёт complex, который не сериализуется в JSON
+    if isinstance(result, complex):
+        raise ValueError("отрицательное основание в дробной степени")
+    return result
+
+
+# ** компилируется в вызов этой функции; имя с подчёркиванием недоступно как функция в выражении
+POWER = '_power'
+# Имя функции: (реализация, наименьшее и наибольшее число аргументов)
+FUNCTIONS = {
+    'sqrt': (math.sqrt, 1, 1),
+    'log': (math.log, 1, 2),
+    'log10': (math.log10, 1, 1),
+    'log2': (math.log2, 1, 1),
+    'exp': (math.exp, 1, 1),
+    'sin': (math.sin, 1, 1),
+    'cos': (math.cos, 1, 1),
+    'tan': (math.tan, 1, 1),
+    'asin': (math.asin, 1, 1),
+    'acos': (math.acos, 1, 1),
+    'atan': (math.atan, 1, 1),
+    'abs': (abs, 1, 1),
+    # Результат — float, как и у векторных версий NumPy
+    'round': (lambda value, digits=0: float(round(value, int(digits))), 1, 2),
+    'floor': (lambda value: float(math.floor(value)), 1, 1),
+    'ceil': (lambda value: float(math.ceil(value)), 1, 1),
+    'min': (min, 2, None),
+    'max': (max, 2, None),
+}
+CONSTANTS = {'pi': math.pi, 'e': math.e, 'tau': math.tau}
+DIVISION_BY_ZERO = "Ошибка: деление на ноль невозможно."
+TOO_LARGE = "Ошибка: результат слишком велик."
+NOT_A_NUMBER = "Ошибка: значения переменных должны быть числами."
+
+
+@lru_cache(maxsize=None)
+def vector_functions():
+    # Векторные версии функций для evaluate_many; NumPy загружается при первом пакетном расчёте
+    np = numpy()
+    return {
+        'sqrt': np.sqrt,
+        'log': lambda value, base=None: np.log(value) if base is None else np.log(value) / np.log(base),
+        'log10': np.log10,
+        'log2': np.log2,
+        'exp': np.exp,
+        'sin': np.sin,
+        'cos': np.cos,
+        'tan': np.tan,
+        'asin': np.arcsin,
+        'acos': np.arccos,
+        'atan': np.arctan,
+        'abs': np.abs,
+        'round': lambda value, digits=0: np.round(value, int(digits)),
+        'floor': np.floor,
+        'ceil': np.ceil,
+        'min': lambda *values: reduce(np.minimum, values),
+        'max': lambda *values: reduce(np.maximum, values),
+        POWER: np.power,
+    }
+
+
+def finite(value):
+    # inf и nan (например, 1e400) не являются допустимыми числами JSON
+    if not math.isfinite(value):
+        raise ValueError(TOO_LARGE)
+    return value
+
+
+def tokenize_expression(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN_RE.match(text, position)
+        if match is None:
+            column = len(text) - len(text[position:].lstrip()) + 1
+            raise ValueError(f"Ошибка: неожиданный символ '{text[column - 1]}' в позиции {column}.")
+        number, name, operator = match.groups()
+        if number is not None:
+            tokens.append(('number', number))
+        elif name is not None:
+            tokens.append(('name', name))
+        else:
+            tokens.append(('op', operator))
+        position = match.end()
+    return tokens
+
+
+class Parser:
+    # Разбор методом восхождения по приоритетам; унарный минус связывает слабее, чем **
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+        self.variables = {}
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def advance(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ValueError("Ошибка: выражение обрывается.")
+        self.position += 1
+        return token
+
+    def expect(self, value):
+        kind, found = self.advance()
+        if found != value:
+            raise ValueError(f"Ошибка: ожидалось '{value}', найдено '{found}'.")
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Ошибка: пустое выражение.")
+        node = self.expression(1)
+        kind, value = self.peek()
+        if kind is not None:
+            raise ValueError(f"Ошибка: лишний символ '{value}'.")
+        return node
+
+    def expression(self, min_precedence):
+        left = self.unary()
+        while True:
+            kind, value = self.peek()
+            if kind != 'op' or value not in BINARY:
+                return left
+            precedence, operator = BINARY[value]
+            if precedence < min_precedence:
+                return left
+            self.position += 1
+            left = ast.BinOp(left, operator(), self.expression(precedence + 1))
+
+    def unary(self):
+        kind, value = self.peek()
+        if kind == 'op' and value in UNARY:
+            self.position += 1
+            return ast.UnaryOp(UNARY[value](), self.unary())
+        return self.power()
+
+    def power(self):
+        base = self.primary()
+        if self.peek() == ('op', '**'):
+            self.position += 1
+            # ** правоассоциативна и допускает унарный минус в показателе: 2 ** -1
+            return ast.Call(ast.Name(POWER, ast.Load()), [base, self.unary()], [])
+        return base
+
+    def primary(self):
+        kind, value = self.advance()
+        if kind == 'number':
+            return ast.Constant(float(value))
+        if kind == 'name':
+            if self.peek() == ('op', '('):
+                return self.call(value)
+            if value in CONSTANTS:
+                return ast.Constant(CONSTANTS[value])
+            return ast.Name(self.variable(value), ast.Load())
+        if value == '(':
+            node = self.expression(1)
+            self.expect(')')
+            return node
+        raise ValueError(f"Ошибка: неожиданный символ '{value}'.")
+
+    def call(self, name):
+        if name not in FUNCTIONS:
+            raise ValueError(f"Ошибка: неизвестная функция {name}.")
+        self.expect('(')
+        args = []
+        if self.peek() != ('op', ')'):
+            args.append(self.expression(1))
+            while self.peek() == ('op', ','):
+                self.position += 1
+                args.append(self.expression(1))
+        self.expect(')')
+        _, least, most = FUNCTIONS[name]
+        if len(args) < least or (most is not None and len(args) > most):
+            raise ValueError(f"Ошибка: неверное число аргументов функции {name}.")
+        return ast.Call(ast.Name(name, ast.Load()), args, [])
+
+    def variable(self, name):
+        # Переменные становятся аргументами _v0, _v1..., чтобы не перекрывать имена функций
+        if name not in self.variables:
+            self.variables[name] = f'_v{len(self.variables)}'
+        return self.variables[name]
+
+
+class Expression:
+    def __init__(self, text):
+        self.text = text
+        parser = Parser(tokenize_expression(text))
+        self.tree = parser.parse()
+        self.variables = tuple(parser.variables)
+        self.arguments = tuple(parser.variables.values())
+        self.namespace = {name: function for name, (function, _, _) in FUNCTIONS.items()}
+        self.namespace[POWER] = power
+        self.function = self.compile(self.arguments, self.tree, self.namespace)
+        self.vector_function = None
+        self.loops = {}
+
+    @staticmethod
+    def compile(names, body, namespace):
+        # Выражение компилируется в байткод функции от своих переменных
+        arguments = ast.arguments(posonlyargs=[], args=[ast.arg(name) for name in names], kwonlyargs=[], kw_defaults=[], defaults=[])
+        tree = ast.fix_missing_locations(ast.Expression(ast.Lambda(arguments, body)))
+        return eval(compile(tree, '<выражение>', 'eval'), {'__builtins__': {}, **namespace})
+
+    def loop_function(self, flags):
+        # Без NumPy цикл по колонкам тоже компилируется: [выражение for _v0, _v1 in zip(_c0, _c1)]
+        if flags not in self.loops:
+            columns = [(argument, f'_c{i}') for i, (argument, flag) in enumerate(zip(self.arguments, flags)) if flag]
+            names = [f'_c{i}' if flag else argument for i, (argument, flag) in enumerate(zip(self.arguments, flags))]
+            if len(columns) == 1:
+                target = ast.Name(columns[0][0], ast.Store())
+                source = ast.Name(columns[0][1], ast.Load())
+            else:
+                target = ast.Tuple([ast.Name(argument, ast.Store()) for argument, _ in columns], ast.Store())
+                source = ast.Call(ast.Name('zip', ast.Load()), [ast.Name(column, ast.Load()) for _, column in columns], [])
+            loop = ast.ListComp(self.tree, [ast.comprehension(target, source, [], 0)])
+            self.loops[flags] = self.compile(names, loop, dict(self.namespace, zip=zip))
+        return self.loops[flags]
+
+    def evaluate(self, variables=None):
+        variables = variables or {}
+        try:
+            values = [variables[name] for name in self.variables]
+        except KeyError as error:
+            raise ValueError(f"Ошибка: не задано значение переменной {error.args[0]}.") from None
+        # Decimal и другие числа приводятся к float, как и в пакетном расчёте
+        if not all(isinstance(value, Number) for value in values):
+            raise ValueError(NOT_A_NUMBER)
+        try:
+            result = self.function(*map(float, values))
+        except ZeroDivisionError:
+            raise ValueError(DIVISION_BY_ZERO) from None
+        except ValueError as error:
+            raise ValueError(f"Ошибка: недопустимое значение аргумента ({error}).") from None
+        except OverflowError:
+            raise ValueError(TOO_LARGE) from None
+        return finite(result)
+
+    def evaluate_many(self, columns):
+        # Числа (в том числе Decimal) подставляются как float-скаляры, последовательности считаются поэлементно
+        values, flags = [], []
+        length = None
+        for name in self.variables:
+            if name not in columns:
+                raise ValueError(f"Ошибка: не задано значение переменной {name}.")
+            value = columns[name]
+            flag = not isinstance(value, Number)
+            if not flag:
+                value = float(value)
+            elif isinstance(value, (str, bytes)) or not hasattr(value, '__len__'):
+                raise ValueError(f"Ошибка: значение переменной {name} должно быть числом или колонкой чисел.")
+            else:
+                if length is None:
+                    length = len(value)
+                elif len(value) != length:
+                    raise ValueError("Ошибка: колонки значений разной длины.")
+            values.append(value)
+            flags.append(flag)
+        if length is None:
+            raise ValueError("Ошибка: для пакетного расчёта нужна хотя бы одна колонка значений.")
+        if numpy() is not None:
+            return self.evaluate_vector(values, flags, length)
+        try:
+            values = [[float(item) for item in value] if flag else value for value, flag in zip(values, flags)]
+        except (TypeError, ValueError):
+            raise ValueError(NOT_A_NUMBER) from None
+        except OverflowError:
+            raise ValueError(TOO_LARGE) from None
+        try:
+            result = self.loop_function(tuple(flags))(*values)
+        except ZeroDivisionError:
+            raise ValueError(DIVISION_BY_ZERO) from None
+        except ValueError as error:
+            raise ValueError(f"Ошибка: недопустимое значение аргумента ({error}).") from None
+        except OverflowError:
+            raise ValueError(TOO_LARGE) from None
+        return [finite(value) for value in result]
+
+    def evaluate_vector(self, values, flags, length):
+        if self.vector_function is None:
+            self.vector_function = self.compile(self.arguments, self.tree, vector_functions())
+        np = numpy()
+        try:
+            arrays = [np.asarray(value, dtype=np.float64) if flag else value for value, flag in zip(values, flags)]
+        except (TypeError, ValueError):
+            raise ValueError(NOT_A_NUMBER) from None
+        try:
+            with np.errstate(divide='raise', over='raise', invalid='raise'):
+                result = self.vector_function(*arrays)
+        except FloatingPointError as error:
+            if 'divide' in str(error):
+                raise ValueError(DIVISION_BY_ZERO) from None
+            if 'overflow' in str(error):
+                raise ValueError(TOO_LARGE) from None
+            raise ValueError(f"Ошибка: недопустимое значение аргумента ({error}).") from None
+        if not np.isfinite(result).all():
+            raise ValueError(TOO_LARGE)
+        return np.broadcast_to(result, (length,)).tolist()
+
+
+@lru_cache(maxsize=512)
+def compile_expression(text):
+    return Expression(text)
@@ -1,39 +1,198 @@
-import json
-import csv
-from datetime import datetime
+import os
 from collections import defaultdict
 import texts
+from managers.storage import LazyManager, SQLITE_SUFFIXES, file_stamp, open_store, index_by_id, resolve_id, date_key, valid_date
+from managers.segments import SegmentedStore
+from managers.csvio import stream_import, optional_int, format_import_stats, select_columns, row_getter, write_csv, COMPRESSION_SUFFIXES
+from managers.columnar import FinanceColumns
+from managers.expressions import compile_expression
+from managers.indexes import DateIndex, INVALID_DAY, epoch_day, month_key, parse_day, intern_text, sortable_date
+from managers.money import DEFAULT_CURRENCY, MINOR_UNITS, to_cents, from_cents
+from managers.instrumentation import count, instrument
+from managers.querycache import cached_query
+from managers.reports import PARTITIONS, ReportRunner, aggregate_partition, merge_partials, month_periods, partition_columns, write_report
+
+FIELDS = ['id', 'amount', 'category', 'date', 'description']
+# В хранилище сумма лежит целым числом копеек; старые файлы со столбцом amount читаются и переписываются
+STORE_FIELDS = ['id', 'cents', 'category', 'date', 'description']
+DATE_KEY = date_key('date')
+INDEXES = {'date': DATE_KEY, 'category': 'unicode_lower(category)'}
+
+def format_date(value):
+    if isinstance(value, str):
+        return value
+    return value.strftime("%d-%m-%Y")
 
 class FinanceRecord:
-    def __init__(self, amount, category, date, description=''):
+    __slots__ = ('id', 'cents', 'category', 'date', 'day', 'description')
+
+    def __init__(self, amount, category, date, description='', cents=None):
         self.id = None
-        self.amount = amount
-        self.category = category
-        self.date = date
+        self.cents = to_cents(amount) if cents is None else cents
+        self.category = intern_text(category)
+        self.date = intern_text(date)
+        self.day = parse_day(date)
         self.description = description
-    
 
-class FinanceManager:
-    def __init__(self, filename='finance.json'):
+    @property
+    def amount(self):
+        return from_cents(self.cents)
+
+    @amount.setter
+    def amount(self, value):
+        self.cents = to_cents(value)
+
+
+class FinanceTotals:
+    # Все суммы в копейках
+    def __init__(self, records=()):
+        self.income = 0
+        self.expense = 0
+        self.count = 0
+        self.categories = defaultdict(int)
+        self.category_counts = defaultdict(int)
+        self.months = defaultdict(int)
+        self.month_counts = defaultdict(int)
+        for record in records:
+            self.add(record)
+
+    def add(self, record, sign=1):
+        amount = record.cents * sign
+        if record.cents > 0:
+            self.income += amount
+        else:
+            self.expense += amount
+        self.count += sign
+        self._bump(self.categories, self.category_counts, record.category, amount, sign)
+        if record.day != INVALID_DAY:
+            self._bump(self.months, self.month_counts, month_key(record.day), amount, sign)
+
+    def remove(self, record):
+        self.add(record, -1)
+
+    @staticmethod
+    def _bump(sums, counts, key, amount, sign):
+        counts[key] += sign
+        if counts[key]:
+            sums[key] += amount
+        else:
+            del counts[key]
+            sums.pop(key, None)
+
+    @property
+    def balance(self):
+        return self.income + self.expense
+
+    def to_dict(self):
+        return {
+            'units': 'cents',
+            'income': self.income,
+            'expense': self.expense,
+            'count': self.count,
+            'categories': [[key, self.categories[key], count] for key, count in self.category_counts.items()],
+            'months': [[key, self.months[key], count] for key, count in self.month_counts.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, totals_dict):
+        totals = cls()
+        totals.income = totals_dict['income']
+        totals.expense = totals_dict['expense']
+        totals.count = totals_dict['count']
+        for key, amount, count in totals_dict['categories']:
+            totals.categories[key] = amount
+            totals.category_counts[key] = count
+        for key, amount, count in totals_dict['months']:
+            totals.months[key] = amount
+            totals.month_counts[key] = count
+        return totals
+
+    def matches(self, other):
+        # Целые суммы сравниваются точно, без допуска на ошибку округления
+        return (
+            self.count == other.count
+            and self.income == other.income
+            and self.expense == other.expense
+            and self.category_counts == other.category_counts
+            and self.month_counts == other.month_counts
+            and self.categories == other.categories
+            and self.months == other.months
+        )
+
+@instrument
+class FinanceManager(LazyManager):
+    lazy_fields = ('records', 'date_index', 'totals')
+
+    def __init__(self, filename='finance.json', commit_window=0.0, codec=None, currency=DEFAULT_CURRENCY, partitioned=True):
         self.filename = filename
+        self.currency = currency
+        if partitioned and not filename.endswith(SQLITE_SUFFIXES):
+            # Записи лежат по сегментам месяцев: новая запись текущего месяца переписывает при сжатии один сегмент
+            self.storage = SegmentedStore(filename, self.record_rows, STORE_FIELDS, 'date', 'cents', self.record_rows_between,
+                                          lambda row: self.record_to_row(self.dict_to_record(row)), commit_window=commit_window, meta=self.totals_meta, codec=codec)
+        else:
+            self.storage = open_store(filename, self.record_rows, 'finance', STORE_FIELDS, INDEXES, commit_window, self.totals_meta, codec)
+        if self.storage.indexed:
+            self.storage.add_column('cents', f'CAST(ROUND(amount * {MINOR_UNITS}) AS INTEGER)')
+        self._columns = None
+
+    def load(self):
+        self._columns = None
         self.records = self.load_records()
+        self.currency = self.storage.meta.get('currency', self.currency)
+        self.date_index = DateIndex(self.records.values())
+        self.totals = self.load_totals()
 
     def load_records(self):
-        try:
-            with open(self.filename, 'r') as file:
-                records_data = json.load(file)
-                return [self.dict_to_record(record) for record in records_data]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        records, renumbered = index_by_id(map(self.dict_to_record, self.storage.load()), self.storage)
+        if renumbered:
+            self.storage.write_snapshot([self.record_to_row(record) for record in records.values()])
+        return records
+
+    def load_totals(self):
+        saved = self.storage.meta.get('totals')
+        if saved and saved.get('units') == 'cents' and self.storage.meta_current and saved['count'] == len(self.records):
+            return FinanceTotals.from_dict(saved)
+        return FinanceTotals(self.records.values())
+
+    def totals_meta(self):
+        totals = vars(self).get('totals')
+        return {'totals': totals.to_dict(), 'currency': self.currency} if totals else {'currency': self.currency}
+
+    def verify_totals(self):
+        return self.totals.matches(FinanceTotals(self.records.values()))
 
     def dict_to_record(self, record_dict):
-        record = FinanceRecord(record_dict['amount'], record_dict['category'], record_dict['date'], record_dict.get('description', ''))
+        cents = record_dict.get('cents')
+        amount = record_dict.get('amount') if cents is None else None
+        record = FinanceRecord(amount, record_dict['category'], record_dict['date'], record_dict.get('description', ''), cents)
         record.id = record_dict['id']
         return record
 
     def save_records(self):
-        with open(self.filename, 'w') as file:
-            json.dump([self.record_to_dict(record) for record in self.records], file)
+        with self.mutation():
+            self.storage.compact()
+
+    def record_rows(self):
+        return [self.record_to_row(record) for record in self.records.values()]
+
+    def record_rows_between(self, first_day, last_day):
+        return [self.record_to_row(self.records[record_id]) for record_id in self.date_index.range(first_day, last_day)]
+
+    def records_between(self, first_day, last_day):
+        # Незагруженный менеджер с сегментами читает только месяцы интервала, а не весь снимок
+        if self.loaded or not self.storage.partitioned:
+            return [self.records[record_id] for record_id in self.date_index.range(first_day, last_day)]
+        return list(map(self.dict_to_record, self.storage.rows_between(first_day, last_day)))
+
+    def record_to_row(self, record):
+        return {
+            'id': record.id,
+            'cents': record.cents,
+            'category': record.category,
+            'date': record.date,
+            'description': record.description
+        }
 
     def record_to_dict(self, record):
         return {
@@ -44,86 +203,259 @@ class FinanceManager:
             'description': record.description
         }
 
+    def current_row(self, record_id):
+        if not self.loaded:
+            return self.storage.get(record_id)
+        record = self.records.get(record_id)
+        return self.record_to_row(record) if record else None
+
+    def apply_row(self, record_id, row):
+        old_record = self.records.pop(record_id, None) if row is None else self.records.get(record_id)
+        if old_record:
+            self.date_index.remove(old_record.day, old_record.id)
+            self.totals.remove(old_record)
+        if row is not None:
+            record = self.records[record_id] = self.dict_to_record(row)
+            self.date_index.add(record.day, record.id)
+            self.totals.add(record)
+        self._columns = None
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            self._columns = FinanceColumns(self.records.values())
+        return self._columns
+
     def get_next_id(self):
-        if not self.records:
-            return 1
-        return max(record.id for record in self.records) + 1
+        self.ensure_loaded()
+        return self.storage.next_id
 
     def add_record(self, amount, category, date, description=''):
-        new_record = FinanceRecord(amount, category, date, description)
-        new_record.id = self.get_next_id()
-        self.records.append(new_record)
-        self.save_records()
+        with self.mutation():
+            new_record = FinanceRecord(amount, category, date, description)
+            new_record.id = self.get_next_id()
+            self.records[new_record.id] = new_record
+            self.date_index.add(new_record.day, new_record.id)
+            self.totals.add(new_record)
+            if self._columns is not None:
+                self._columns.append(new_record)
+            self.storage.insert(self.record_to_row(new_record))
+
+    def get_record_by_id(self, record_id):
+        if self.loaded:
+            return self.records.get(record_id)
+        row = self.storage.get(record_id)
+        return self.dict_to_record(row) if row else None
+
+    def edit_record(self, record_id, amount=None, category=None, date=None, description=None, expected=None):
+        with self.mutation(record_id, expected):
+            record = self.records.get(record_id)
+            if not record:
+                return False
+            # Сумма разбирается заранее, чтобы ошибка ввода не оставила итоги без записи
+            cents = record.cents if amount is None else to_cents(amount)
+            old = self.record_to_row(record)
+            self.date_index.remove(record.day, record.id)
+            self.totals.remove(record)
+            record.cents = cents
+            if category:
+                record.category = intern_text(category)
+            if date:
+                record.date = intern_text(date)
+                record.day = parse_day(date)
+            if description is not None:
+                record.description = description
+            self.date_index.add(record.day, record.id)
+            self.totals.add(record)
+            self._columns = None
+            self.storage.update(self.record_to_row(record), old=old)
+            return True
+
+    def delete_record(self, record_id):
+        with self.mutation():
+            record = self.records.pop(record_id, None)
+            if record:
+                self.date_index.remove(record.day, record.id)
+                self.totals.remove(record)
+                self._columns = None
+                self.storage.delete(record_id, old=self.record_to_row(record))
 
     def view_records(self):
-        return [self.record_to_dict(record) for record in self.records]
+        return [self.record_to_dict(record) for record in self.records.values()]
 
+    @cached_query()
     def filter_records(self, category=None, start_date=None, end_date=None):
-        filtered = self.records
+        if self.storage.indexed:
+            return self.query_records(category, start_date, end_date)
+        if start_date or end_date:
+            filtered = self.records_between(epoch_day(start_date) if start_date else None, epoch_day(end_date) if end_date else None)
+        else:
+            filtered = self.records.values()
+        count('records_scanned', len(filtered))
+        if category:
+            category = category.lower()
+            filtered = [record for record in filtered if record.category.lower() == category]
+        return [self.record_to_dict(record) for record in filtered]
+
+    def query_records(self, category, start_date, end_date):
+        conditions, params = [], []
         if category:
-            filtered = [record for record in filtered if record.category.lower() == category.lower()]
+            conditions.append('unicode_lower(category) = ?')
+            params.append(category.lower())
         if start_date:
-            filtered = [record for record in filtered if datetime.strptime(record.date, "%d-%m-%Y") >= datetime.strptime(start_date, "%d-%m-%Y")]
+            conditions.append(f'{DATE_KEY} >= ?')
+            params.append(sortable_date(start_date))
         if end_date:
-            filtered = [record for record in filtered if datetime.strptime(record.date, "%d-%m-%Y") <= datetime.strptime(end_date, "%d-%m-%Y")]
-        return [self.record_to_dict(record) for record in filtered]
+            conditions.append(f'{DATE_KEY} <= ?')
+            params.append(sortable_date(end_date))
+        if start_date or end_date:
+            conditions.append(valid_date('date'))
+        return [self.record_to_dict(self.dict_to_record(row)) for row in self.storage.select(' AND '.join(conditions), params)]
 
-    def generate_report(self, start_date, end_date):
-        filtered_records = self.filter_records(start_date=start_date, end_date=end_date)
-        total_income = sum(record.amount for record in filtered_records if record.amount > 0)
-        total_expense = sum(record.amount for record in filtered_records if record.amount < 0)
-        
-        report_filename = f'report_{start_date.strftime("%d-%m-%Y")}_{end_date.strftime("%d-%m-%Y")}.csv'
+    def evaluate_column(self, expression):
+        # Производная колонка по всем записям, например "amount * 1.2"
+        columns = self.columns
+        return dict(zip(columns.ids, compile_expression(expression.strip()).evaluate_many({'amount': columns.currency_amounts()})))
 
-        with open(report_filename, 'w', newline='') as csvfile:
-            fieldnames = ['id', 'amount', 'category', 'date', 'description']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    # Повторный отчёт за тот же период отдаётся из памяти, пока файл отчёта не тронут
+    @cached_query(stamp=lambda report: file_stamp(report['report_filename']))
+    def generate_report(self, start_date, end_date, columns=None, compression=None, include_records=True, derived=None):
+        start_date, end_date = format_date(start_date), format_date(end_date)
+        start_day, end_day = epoch_day(start_date), epoch_day(end_date)
+        records = self.records_between(start_day, end_day)
+        if self.loaded:
+            total_income, total_expense = map(from_cents, self.columns.totals(start_day, end_day))
+        else:
+            total_income = from_cents(sum(record.cents for record in records if record.cents > 0))
+            total_expense = from_cents(sum(record.cents for record in records if record.cents < 0))
+        columns = select_columns(FIELDS, columns)
+        derived = derived or {}
 
-            writer.writeheader()
-            for record in filtered_records:
-                writer.writerow(self.record_to_dict(record))
+        report_filename = self.report_path(start_date, end_date, COMPRESSION_SUFFIXES.get(compression, ''))
+        # Строки пишутся в файл по мере обхода, без промежуточного списка словарей
+        extra = []
+        if derived:
+            amounts = [record.cents / MINOR_UNITS for record in records]
+            extra = [compile_expression(expression.strip()).evaluate_many({'amount': amounts}) for expression in derived.values()]
+        rows = map(row_getter(columns), records)
+        if extra:
+            rows = map(lambda row, *values: row + values, rows, *extra)
+        write_csv(report_filename, columns + list(derived), rows, compression)
 
-        return {
+        report = {
             'total_income': total_income,
             'total_expense': total_expense,
             'balance': total_income + total_expense,
-            'records': filtered_records
+            'report_filename': report_filename
         }
+        if include_records:
+            report['records'] = [self.record_to_dict(record) for record in records]
+        return report
+
+    def report_path(self, start_date, end_date, suffix=''):
+        # Отчёты лежат рядом с файлом данных, а не в текущем каталоге процесса
+        return os.path.join(os.path.dirname(self.filename), f'report_{start_date}_{end_date}.csv{suffix}')
+
+    def generate_reports(self, periods=None, year=None, columns=None, compression=None, include_records=False, partition='month', workers=None):
+        # Пакет отчётов за один вызов: итоги считаются по партициям журнала (месяцам или категориям)
+        # в пуле процессов и складываются, CSV всех периодов пишутся параллельно.
+        # year без periods — двенадцать месячных отчётов и годовой
+        if partition not in PARTITIONS:
+            raise ValueError(f"Ошибка: разбиение {partition} не поддерживается. Доступны: {', '.join(PARTITIONS)}.")
+        if periods is None:
+            if year is None:
+                raise ValueError("Ошибка: укажите периоды отчётов или год.")
+            periods = month_periods(year)
+        if not periods:
+            return []
+        periods = [(format_date(start_date), format_date(end_date)) for start_date, end_date in periods]
+        days = [(epoch_day(start_date), epoch_day(end_date)) for start_date, end_date in periods]
+        columns = select_columns(FIELDS, columns)
+        getter = row_getter(['cents' if column == 'amount' else column for column in columns])
+        suffix = COMPRESSION_SUFFIXES.get(compression, '')
+        filenames = [self.report_path(start_date, end_date, suffix) for start_date, end_date in periods]
+        record_ids = [self.date_index.range(start_day, end_day) for start_day, end_day in days]
+        ledger = self.columns
+
+        with ReportRunner(len(ledger), workers) as runner:
+            # Строки периода собираются здесь, пока пул уже пишет файлы предыдущих периодов
+            writes = runner.map(write_report, (
+                (filename, columns, [getter(self.records[record_id]) for record_id in ids], compression)
+                for filename, ids in zip(filenames, record_ids)
+            ))
+            partitions = partition_columns(ledger, partition, min(start for start, _ in days), max(end for _, end in days))
+            totals = merge_partials(runner.map(aggregate_partition, [(part, days) for part in partitions]), len(days))
+            list(writes)
 
-    def export_to_csv(self, csv_filename='finance.csv'):
-        with open(csv_filename, 'w', newline='') as csvfile:
-            fieldnames = ['id', 'amount', 'category', 'date', 'description']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        reports = []
+        for (start_date, end_date), filename, ids, (income, expense, count, categories) in zip(periods, filenames, record_ids, totals):
+            report = {
+                'start_date': start_date,
+                'end_date': end_date,
+                'total_income': from_cents(income),
+                'total_expense': from_cents(expense),
+                'balance': from_cents(income + expense),
+                'count': count,
+                'by_category': {ledger.categories[code]: from_cents(cents) for code, cents in sorted(categories.items())},
+                'report_filename': filename
+            }
+            if include_records:
+                report['records'] = [self.record_to_dict(self.records[record_id]) for record_id in ids]
+            reports.append(report)
+        return reports
 
-            writer.writeheader()
-            for record in self.records:
-                writer.writerow(self.record_to_dict(record))
+    def iter_record_rows(self, columns=FIELDS):
+        records = self.records.values() if self.loaded else map(self.dict_to_record, self.storage.iter_rows())
+        return map(row_getter(columns), records)
 
-    def import_from_csv(self, csv_filename='finance.csv'):
-        with open(csv_filename, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                record = FinanceRecord(float(row['amount']), row['category'], row['date'], row.get('description', ''))
-                record.id = int(row['id'])
-                self.records.append(record)
-            self.save_records()
+    def export_to_csv(self, csv_filename='finance.csv', columns=None, compression=None):
+        columns = select_columns(FIELDS, columns)
+        write_csv(csv_filename, columns, self.iter_record_rows(columns), compression)
+
+    def import_from_csv(self, csv_filename='finance.csv', batch_size=10000, on_conflict='renumber', progress=None):
+        return stream_import(csv_filename, self.csv_to_record, lambda record: self.import_record(record, on_conflict), self.mutation, batch_size, progress, self.index_imported)
+
+    def index_imported(self, records):
+        # Индекс дат пополняется один раз на пачку: сжатие журнала при снятии блокировки читает сегменты по нему
+        self.date_index.add_many(records)
+        self._columns = None
+
+    def csv_to_record(self, row):
+        record = FinanceRecord(row['amount'], row['category'], row['date'], row.get('description', ''))
+        record.id = optional_int(row.get('id'))
+        return record
+
+    def import_record(self, record, on_conflict='renumber'):
+        status = resolve_id(self.records, record, self.storage, on_conflict)
+        if status == 'skipped':
+            return status
+        if status == 'replaced':
+            old = self.records[record.id]
+            self.date_index.remove(old.day, old.id)
+            self.totals.remove(old)
+            self.records[record.id] = record
+            self.totals.add(record)
+            self.storage.update(self.record_to_row(record), old=self.record_to_row(old))
+        else:
+            self.totals.add(record)
+            self.storage.insert(self.record_to_row(record))
+        return status
 
     def calculate_balance(self):
-        total_income = sum(record.amount for record in self.records if record.amount > 0)
-        total_expense = sum(record.amount for record in self.records if record.amount < 0)
-        return total_income + total_expense
+        return from_cents(self.totals.balance)
 
     def group_by_category(self):
-        grouped = defaultdict(float)
-        for record in self.records:
-            grouped[record.category] += record.amount
-        return dict(grouped)
+        return {key: from_cents(cents) for key, cents in self.totals.categories.items()}
+
+    def group_by_month(self):
+        return {key: from_cents(cents) for key, cents in self.totals.months.items()}
 
 def manage_finances(finance_manager: FinanceManager) -> None:
+    finance_manager.sync()
     print(texts.FINANCES)
     action = input("Выберите действие: ")
     if action == '1':
-        amount = float(input("Введите сумму: "))
+        amount = input("Введите сумму: ")
         category = input("Введите категорию: ")
         date = input("Введите дату (DD-MM-YYYY): ")
         description = input("Введите описание (необязательно): ")
@@ -147,4 +479,4 @@ def manage_finances(finance_manager: FinanceManager) -> None:
         finance_manager.export_to_csv(filename)
     elif action == '5':
         filename = input("Введите имя файла: ")
-        finance_manager.import_from_csv(filename)
+        print(format_import_stats(finance_manager.import_from_csv(filename)))
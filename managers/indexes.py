@@ -0,0 +1,254 @@
+import heapq
+import math
+import re
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import date
+from functools import lru_cache
+from itertools import chain, islice
+
+from managers.numeric import numpy
+
+EPOCH = date(1970, 1, 1).toordinal()
+# Записи с некорректной датой не попадают ни в один диапазон дат
+INVALID_DAY = -2 ** 31
+WORD_RE = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=65536)
+def epoch_day(value):
+    # Разбор split быстрее strptime; любая ошибка формата даёт одно и то же сообщение
+    try:
+        day, month, year = value.split('-')
+        return date(int(year), int(month), int(day)).toordinal() - EPOCH
+    except ValueError:
+        raise ValueError(f"Ошибка: неверная дата '{value}', ожидается формат ДД-ММ-ГГГГ.") from None
+
+
+def sortable_date(value):
+    # DD-MM-YYYY -> YYYYMMDD для сравнения с ключом даты в SQLite; ошибки формата те же, что у epoch_day
+    return date.fromordinal(epoch_day(value) + EPOCH).strftime('%Y%m%d')
+
+
+@lru_cache(maxsize=65536)
+def month_key(day):
+    return date.fromordinal(day + EPOCH).strftime('%Y-%m')
+
+
+def intern_text(value):
+    # Повторяющиеся строки (категории, приоритеты, даты) хранятся в одном экземпляре
+    return sys.intern(value) if type(value) is str else value
+
+
+def parse_day(value):
+    try:
+        return epoch_day(value)
+    except (AttributeError, TypeError, ValueError):
+        return INVALID_DAY
+
+
+class DateIndex:
+    def __init__(self, records=()):
+        pairs = sorted((record.day, record.id) for record in records if record.day != INVALID_DAY)
+        self.days = array('i', [day for day, _ in pairs])
+        self.ids = array('q', [record_id for _, record_id in pairs])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, day, record_id):
+        if day == INVALID_DAY:
+            return
+        position = bisect_right(self.days, day)
+        self.days.insert(position, day)
+        self.ids.insert(position, record_id)
+
+    def add_many(self, records):
+        # Пачка записей вливается одним слиянием: вставка по одной сдвигала бы массивы на каждой записи
+        pairs = sorted((record.day, record.id) for record in records if record.day != INVALID_DAY)
+        if not pairs:
+            return
+        days, ids = array('i', [day for day, _ in pairs]), array('q', [record_id for _, record_id in pairs])
+        np = numpy() if self.days and days[0] < self.days[-1] else None
+        if np is not None:
+            positions = np.searchsorted(np.asarray(self.days), np.asarray(days), side='right')
+            self.days = array('i', np.insert(np.asarray(self.days), positions, days).tobytes())
+            self.ids = array('q', np.insert(np.asarray(self.ids), positions, ids).tobytes())
+            return
+        if self.days and days[0] < self.days[-1]:
+            # Две отсортированные серии timsort сливает за линейное время
+            pairs = sorted(chain(zip(self.days, self.ids), pairs))
+            self.days, self.ids = array('i', [day for day, _ in pairs]), array('q', [record_id for _, record_id in pairs])
+            return
+        self.days.extend(days)
+        self.ids.extend(ids)
+
+    def remove(self, day, record_id):
+        if day == INVALID_DAY:
+            return
+        start, end = bisect_left(self.days, day), bisect_right(self.days, day)
+        for position in range(start, end):
+            if self.ids[position] == record_id:
+                del self.days[position]
+                del self.ids[position]
+                return
+
+    def range(self, start_day=None, end_day=None):
+        start = 0 if start_day is None else bisect_left(self.days, start_day)
+        end = len(self.days) if end_day is None else bisect_right(self.days, end_day)
+        return self.ids[start:end].tolist()
+
+
+def tokenize(text):
+    # casefold приводит кириллицу к нижнему регистру, «ё» ищется как «е»
+    return [word.casefold().replace('ё', 'е') for word in WORD_RE.findall(text or '')]
+
+
+class InvertedIndex:
+    def __init__(self):
+        self.postings = {}
+        self.count = 0
+
+    def add(self, doc_id, text):
+        for term, frequency in Counter(tokenize(text)).items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+        self.count += 1
+
+    def remove(self, doc_id, text):
+        for term in set(tokenize(text)):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.count -= 1
+
+    def search(self, query, limit=None):
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        postings = sorted((self.postings.get(term, {}) for term in terms), key=len)
+        # Пересечение начинаем с самого редкого слова
+        candidates = postings[0].keys()
+        for docs in postings[1:]:
+            candidates = [doc_id for doc_id in candidates if doc_id in docs]
+        weights = [(docs, math.log(1 + self.count / len(docs))) for docs in postings if docs]
+        scored = [(sum(docs[doc_id] * weight for docs, weight in weights), doc_id) for doc_id in candidates]
+        if limit is not None:
+            scored = heapq.nlargest(limit, scored)
+        else:
+            scored.sort(reverse=True)
+        return [doc_id for _, doc_id in scored]
+
+    def to_dict(self):
+        return {'count': self.count, 'postings': {term: list(docs.items()) for term, docs in self.postings.items()}}
+
+    @classmethod
+    def from_dict(cls, index_dict):
+        index = cls()
+        index.count = index_dict['count']
+        index.postings = {term: dict(docs) for term, docs in index_dict['postings'].items()}
+        return index
+
+
+class TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = None
+
+
+class PrefixTrie:
+    def __init__(self):
+        self.root = TrieNode()
+
+    def add(self, word, item_id):
+        node = self.root
+        for char in word:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = TrieNode()
+            node = child
+        if node.ids is None:
+            node.ids = set()
+        node.ids.add(item_id)
+
+    def remove(self, word, item_id):
+        path = []
+        node = self.root
+        for char in word:
+            path.append((node, char))
+            node = node.children.get(char)
+            if node is None:
+                return
+        if node.ids:
+            node.ids.discard(item_id)
+            if not node.ids:
+                node.ids = None
+        # Удаляем опустевшие ветки, чтобы дерево не росло от правок
+        for parent, char in reversed(path):
+            child = parent.children[char]
+            if child.ids or child.children:
+                break
+            del parent.children[char]
+
+    def search(self, prefix, limit=None):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        found = []
+        seen = set()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.ids:
+                for item_id in sorted(node.ids):
+                    if item_id not in seen:
+                        seen.add(item_id)
+                        found.append(item_id)
+                        if limit is not None and len(found) >= limit:
+                            return found
+            stack.extend(node.children[char] for char in sorted(node.children, reverse=True))
+        return found
+
+
+class NgramIndex:
+    def __init__(self, n=3):
+        self.n = n
+        self.grams = {}
+        self.values = {}
+
+    def ngrams(self, value):
+        return {value[i:i + self.n] for i in range(len(value) - self.n + 1)}
+
+    def add(self, item_id, value):
+        if not value:
+            return
+        self.values[item_id] = value
+        for gram in self.ngrams(value):
+            self.grams.setdefault(gram, set()).add(item_id)
+
+    def remove(self, item_id):
+        value = self.values.pop(item_id, None)
+        if value is None:
+            return
+        for gram in self.ngrams(value):
+            ids = self.grams.get(gram)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self.grams[gram]
+
+    def search(self, query, limit=None):
+        if len(query) < self.n:
+            found = (item_id for item_id, value in self.values.items() if query in value)
+            return list(islice(found, limit))
+        postings = sorted((self.grams.get(gram, set()) for gram in self.ngrams(query)), key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        found = sorted(item_id for item_id in candidates if query in self.values[item_id])
+        return found if limit is None else found[:limit]
@@ -0,0 +1,281 @@
+import atexit
+import cProfile
+import functools
+import json
+import os
+import re
+import threading
+import time
+import types
+import weakref
+from contextlib import contextmanager
+from datetime import datetime
+
+# Замеры включаются переменными окружения или флагами --stats/--profile командной строки и сервера:
+#   ASSISTANT_STATS=1                  считать время и объёмы по методам менеджеров
+#   ASSISTANT_STATS_FILE=stats.json    периодически сбрасывать статистику в файл (включает замеры)
+#   ASSISTANT_STATS_INTERVAL=60        период сброса, секунды
+#   ASSISTANT_PROFILE=profiles         сохранять cProfile каждого запуска в каталог
+STATS_ENV = 'ASSISTANT_STATS'
+STATS_FILE_ENV = 'ASSISTANT_STATS_FILE'
+STATS_INTERVAL_ENV = 'ASSISTANT_STATS_INTERVAL'
+PROFILE_ENV = 'ASSISTANT_PROFILE'
+DUMP_INTERVAL = 60.0
+# Построчные преобразования вызываются миллион раз за загрузку; их время входит в вызывающий метод
+# locked и batch — контекстные менеджеры: обёртка замерила бы только их создание
+PER_ROW_METHOD_RE = re.compile(r'_to_|^(un)?index_|^import_(?!from)|^(current|apply)_row$|^get_next_id$|^(locked|batch)$')
+COUNTERS = ('bytes_read', 'bytes_written', 'records_scanned')
+# Атрибут объекта с его собственными замерами: у каждого менеджера и хранилища свои итоги
+OWNER_ATTRIBUTE = '_operation_stats'
+
+
+class Histogram:
+    # Корзины по степеням двойки в микросекундах: 0 — до 1 мкс, 10 — около миллисекунды
+    __slots__ = ('calls', 'total', 'min', 'max', 'buckets', 'counters')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        bucket = int(seconds * 1e6).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def quantile(self, share):
+        # Верхняя граница корзины, в которую попадает заданная доля вызовов
+        needed = share * self.calls
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= needed:
+                return min(2 ** bucket / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'total_s': self.total,
+            'mean_ms': self.total / self.calls * 1000 if self.calls else 0.0,
+            'min_ms': (self.min or 0.0) * 1000,
+            'p50_ms': self.quantile(0.5) * 1000,
+            'p95_ms': self.quantile(0.95) * 1000,
+            'max_ms': self.max * 1000,
+            'histogram_us': {f'<{2 ** bucket}': count for bucket, count in sorted(self.buckets.items())},
+            **self.counters,
+        }
+
+
+class Stats:
+    def __init__(self):
+        self.enabled = False
+        self.operations = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.started = time.time()
+        self.classes = []
+        self.owners = weakref.WeakSet()
+        self.dump_filename = None
+        self.dump_interval = DUMP_INTERVAL
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def register(self, cls):
+        self.classes.append(cls)
+        if self.enabled:
+            wrap_methods(cls)
+        return cls
+
+    def enable(self, dump_filename=None, dump_interval=None):
+        with self._lock:
+            if not self.enabled:
+                self.enabled = True
+                for cls in self.classes:
+                    wrap_methods(cls)
+        if dump_filename:
+            if self.dump_filename is None:
+                atexit.register(self.dump)
+            self.dump_filename = dump_filename
+            self.dump_interval = dump_interval or self.dump_interval
+            self._schedule()
+
+    def operation(self, name, owner=None):
+        with self._lock:
+            if owner is None:
+                operations = self.operations
+            else:
+                operations = vars(owner).get(OWNER_ATTRIBUTE)
+                if operations is None:
+                    operations = vars(owner)[OWNER_ATTRIBUTE] = {}
+                    self.owners.add(owner)
+            histogram = operations.get(name)
+            if histogram is None:
+                histogram = operations[name] = Histogram()
+            return histogram
+
+    @contextmanager
+    def measure(self, name, owner=None):
+        # Вызов учитывается в общих итогах процесса и в итогах объекта, чей метод вызван.
+        # Счётчики внутри вызова относятся к самому внутреннему методу и к общим итогам
+        stack = self._stack()
+        key = (id(owner), name)
+        if stack and stack[-1][0] == key:
+            # super() переопределённого метода — тот же вызов, второй раз не считаем
+            yield
+            return
+        histograms = [self.operation(name)] if owner is None else [self.operation(name), self.operation(name, owner)]
+        stack.append((key, histograms))
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            with self._lock:
+                for histogram in histograms:
+                    histogram.add(elapsed)
+
+    def count(self, name, value=1):
+        stack = self._stack()
+        with self._lock:
+            self.counters[name] += value
+            if stack:
+                for histogram in stack[-1][1]:
+                    histogram.counters[name] += value
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def snapshot(self, *prefixes):
+        prefixes = prefixes or ('',)
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'uptime_s': time.time() - self.started,
+                'counters': dict(self.counters),
+                'operations': {name: histogram.to_dict() for name, histogram in sorted(self.operations.items()) if name.startswith(prefixes)},
+            }
+
+    def owner_snapshot(self, *owners):
+        # Замеры только этих объектов; счётчики — сумма по их методам
+        with self._lock:
+            operations = {}
+            for owner in owners:
+                operations.update((name, histogram.to_dict()) for name, histogram in vars(owner).get(OWNER_ATTRIBUTE, {}).items())
+            return {
+                'enabled': self.enabled,
+                'uptime_s': time.time() - self.started,
+                'counters': {name: sum(operation[name] for operation in operations.values()) for name in COUNTERS},
+                'operations': dict(sorted(operations.items())),
+            }
+
+    def reset(self):
+        with self._lock:
+            for owner in self.owners:
+                vars(owner).pop(OWNER_ATTRIBUTE, None)
+            self.owners = weakref.WeakSet()
+            self.operations.clear()
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.started = time.time()
+
+    def dump(self, filename=None):
+        filename = filename or self.dump_filename
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as file:
+            json.dump(dict(self.snapshot(), pid=os.getpid(), dumped=datetime.now().isoformat(timespec='seconds')), file, ensure_ascii=False, indent=2)
+        os.replace(tmp_filename, filename)
+
+    def _schedule(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.dump_interval, self._dump_periodically)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _dump_periodically(self):
+        try:
+            self.dump()
+        except OSError:
+            pass
+        self._schedule()
+
+
+STATS = Stats()
+
+
+def instrumented_method(attribute, method):
+    # Имя замера берётся по классу объекта, а не по классу, где определён метод:
+    # унаследованные методы SegmentedStore учитываются под SegmentedStore, а не JournalStore
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with STATS.measure(f'{type(self).__name__}.{attribute}', self):
+            return method(self, *args, **kwargs)
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+def wrap_methods(cls):
+    for attribute, method in list(vars(cls).items()):
+        if attribute.startswith('_') or PER_ROW_METHOD_RE.search(attribute):
+            continue
+        if isinstance(method, types.FunctionType) and not getattr(method, 'instrumented', False):
+            setattr(cls, attribute, instrumented_method(attribute, method))
+
+
+def instrument(cls):
+    # Без включённых замеров методы класса остаются нетронутыми и ничего не стоят
+    return STATS.register(cls)
+
+
+def count(name, value=1):
+    if STATS.enabled:
+        STATS.count(name, value)
+
+
+def stats(*prefixes):
+    return STATS.snapshot(*prefixes)
+
+
+def owner_stats(*owners):
+    return STATS.owner_snapshot(*owners)
+
+
+def enable(dump_filename=None, dump_interval=None):
+    STATS.enable(dump_filename, dump_interval)
+
+
+@contextmanager
+def profiled(directory=None):
+    # Профиль всего сеанса сохраняется в отдельный файл: profile-<время>-<pid>.prof
+    directory = directory or os.environ.get(PROFILE_ENV)
+    if not directory:
+        yield None
+        return
+    os.makedirs(directory, exist_ok=True)
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        profile.dump_stats(os.path.join(directory, f"profile-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.prof"))
+
+
+def enable_from_environment():
+    dump_filename = os.environ.get(STATS_FILE_ENV)
+    if os.environ.get(STATS_ENV) or dump_filename:
+        enable(dump_filename, float(os.environ.get(STATS_INTERVAL_ENV, DUMP_INTERVAL)))
+
+
+enable_from_environment()
@@ -0,0 +1,23 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+
+# Суммы хранятся целым числом копеек (минимальных единиц валюты): сложение точное и быстрое
+MINOR_DIGITS = 2
+MINOR_UNITS = 10 ** MINOR_DIGITS
+DEFAULT_CURRENCY = 'RUB'
+
+
+def to_cents(value):
+    if type(value) is int:
+        return value * MINOR_UNITS
+    try:
+        # str(float) даёт кратчайшую запись числа, поэтому 0.1 превращается ровно в 10 копеек
+        amount = value if isinstance(value, Decimal) else Decimal(str(value).strip().replace(',', '.'))
+        if amount.is_finite():
+            return int(amount.scaleb(MINOR_DIGITS).to_integral_value(ROUND_HALF_EVEN))
+    except InvalidOperation:
+        pass
+    raise ValueError(f"Ошибка: некорректная сумма {value}.")
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-MINOR_DIGITS)
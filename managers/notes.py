@@ -1,41 +1,83 @@
 import json
-import csv
 from datetime import datetime
 import texts
+from managers.storage import LazyManager, ConflictError, open_store, index_by_id, resolve_id, atomic_write
+from managers.csvio import stream_import, optional_int, format_import_stats, select_columns, row_getter, write_csv
+from managers.indexes import InvertedIndex
+from managers.instrumentation import instrument
+from managers.querycache import cached_query
+
+FIELDS = ['id', 'title', 'content', 'timestamp']
 
 class Note:
-    def __init__(self, title, content=''):
+    __slots__ = ('id', 'title', 'content', 'timestamp')
+
+    def __init__(self, title, content='', timestamp=None):
         self.id = None
         self.title = title
         self.content = content
-        self.timestamp = self.get_current_timestamp()
+        self.timestamp = timestamp or self.get_current_timestamp()
 
     @staticmethod
     def get_current_timestamp():
         return datetime.now().strftime("%d-%m-%Y %H:%M:%S")
 
-class NotesManager:
-    def __init__(self, filename='notes.json'):
+@instrument
+class NotesManager(LazyManager):
+    lazy_fields = ('notes', 'search_index')
+
+    def __init__(self, filename='notes.json', commit_window=0.0, codec=None):
         self.filename = filename
+        self.index_filename = filename + '.index'
+        self.storage = open_store(filename, self.note_rows, 'notes', FIELDS, commit_window=commit_window, codec=codec)
+        self.storage.snapshot_hooks.append(self.save_search_index)
+
+    def load(self):
         self.notes = self.load_notes()
+        self.search_index = self.load_search_index()
 
     def load_notes(self):
+        notes, renumbered = index_by_id(map(self.dict_to_note, self.storage.load()), self.storage)
+        if renumbered:
+            self.storage.write_snapshot([self.note_to_dict(note) for note in notes.values()])
+        return notes
+
+    def load_search_index(self):
         try:
-            with open(self.filename, 'r') as file:
-                notes_data = json.load(file)
-                return [self.dict_to_note(note) for note in notes_data]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+            with open(self.index_filename, 'r') as file:
+                saved = json.load(file)
+            if saved['generation'] == self.storage.generation and saved['count'] == len(self.notes):
+                return InvertedIndex.from_dict(saved)
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+        search_index = InvertedIndex()
+        for note in self.notes.values():
+            search_index.add(note.id, self.note_text(note))
+        return search_index
+
+    def save_search_index(self):
+        # Индекс ещё не построен, если снимок пишется во время загрузки
+        search_index = vars(self).get('search_index')
+        if search_index is None:
+            return
+        saved = dict(search_index.to_dict(), generation=self.storage.generation)
+        atomic_write(self.index_filename, lambda file: file.write(json.dumps(saved)))
+
+    @staticmethod
+    def note_text(note):
+        return f'{note.title}\n{note.content}'
 
     def dict_to_note(self, note_dict):
-        note = Note(note_dict['title'], note_dict['content'])
+        note = Note(note_dict['title'], note_dict['content'], note_dict['timestamp'])
         note.id = note_dict['id']
-        note.timestamp = note_dict['timestamp']
         return note
 
     def save_notes(self):
-        with open(self.filename, 'w') as file:
-            json.dump([self.note_to_dict(note) for note in self.notes], file)
+        with self.mutation():
+            self.storage.compact()
+
+    def note_rows(self):
+        return [self.note_to_dict(note) for note in self.notes.values()]
 
     def note_to_dict(self, note):
         return {
@@ -45,60 +87,107 @@ class NotesManager:
             'timestamp': note.timestamp
         }
 
+    def current_row(self, note_id):
+        if not self.loaded:
+            return self.storage.get(note_id)
+        note = self.notes.get(note_id)
+        return self.note_to_dict(note) if note else None
+
+    def apply_row(self, note_id, row):
+        old_note = self.notes.pop(note_id, None) if row is None else self.notes.get(note_id)
+        if old_note:
+            self.search_index.remove(old_note.id, self.note_text(old_note))
+        if row is not None:
+            note = self.notes[note_id] = self.dict_to_note(row)
+            self.search_index.add(note.id, self.note_text(note))
+
     def get_next_id(self):
-        if not self.notes:
-            return 1
-        return max(note.id for note in self.notes) + 1
+        self.ensure_loaded()
+        return self.storage.next_id
 
     def create_note(self, title, content=''):
-        new_note = Note(title, content)
-        new_note.id = self.get_next_id()
-        self.notes.append(new_note)
-        self.save_notes()
+        with self.mutation():
+            new_note = Note(title, content)
+            new_note.id = self.get_next_id()
+            self.notes[new_note.id] = new_note
+            self.search_index.add(new_note.id, self.note_text(new_note))
+            self.storage.insert(self.note_to_dict(new_note))
 
     def view_notes(self):
-        return [(note.id, note.title, note.timestamp) for note in self.notes]
+        return [(note.id, note.title, note.timestamp) for note in self.notes.values()]
+
+    def get_note_by_id(self, note_id):
+        if self.loaded:
+            return self.notes.get(note_id)
+        row = self.storage.get(note_id)
+        return self.dict_to_note(row) if row else None
 
     def view_note_details(self, note_id):
-        for note in self.notes:
-            if note.id == note_id:
-                return self.note_to_dict(note)
+        if self.storage.indexed or not self.loaded:
+            return self.storage.get(note_id)
+        note = self.get_note_by_id(note_id)
+        if note:
+            return self.note_to_dict(note)
         return None
 
-    def edit_note(self, note_id, title=None, content=None):
-        note = self.view_note_details(note_id)
-        if note:
-            if title:
-                note.title = title
-            if content:
-                note.content = content
-            note.timestamp = Note.get_current_timestamp()
-            self.save_notes()
+    def edit_note(self, note_id, title=None, content=None, expected=None):
+        with self.mutation(note_id, expected):
+            note = self.notes.get(note_id)
+            if note:
+                self.search_index.remove(note.id, self.note_text(note))
+                if title:
+                    note.title = title
+                if content:
+                    note.content = content
+                note.timestamp = Note.get_current_timestamp()
+                self.search_index.add(note.id, self.note_text(note))
+                self.storage.update(self.note_to_dict(note))
 
     def delete_note(self, note_id):
-        self.notes = [note for note in self.notes if note.id != note_id]
-        self.save_notes()
-
-    def export_to_csv(self, csv_filename='notes.csv'):
-        with open(csv_filename, 'w', newline='') as csvfile:
-            fieldnames = ['id', 'title', 'content', 'timestamp']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            writer.writeheader()
-            for note in self.notes:
-                writer.writerow(self.note_to_dict(note))
-
-    def import_from_csv(self, csv_filename='notes.csv'):
-        with open(csv_filename, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                note = Note(row['title'], row['content'])
-                note.id = int(row['id'])
-                note.timestamp = row['timestamp']
-                self.notes.append(note)
-            self.save_notes()
+        with self.mutation():
+            note = self.notes.pop(note_id, None)
+            if note:
+                self.search_index.remove(note.id, self.note_text(note))
+                self.storage.delete(note_id)
+
+    @cached_query()
+    def search_notes(self, query, limit=None):
+        return [self.note_to_dict(self.notes[note_id]) for note_id in self.search_index.search(query, limit)]
+
+    def iter_note_rows(self, columns=FIELDS):
+        # Незагруженный менеджер выгружает записи прямо из хранилища
+        notes = self.notes.values() if self.loaded else map(self.dict_to_note, self.storage.iter_rows())
+        return map(row_getter(columns), notes)
+
+    def export_to_csv(self, csv_filename='notes.csv', columns=None, compression=None):
+        columns = select_columns(FIELDS, columns)
+        write_csv(csv_filename, columns, self.iter_note_rows(columns), compression)
+
+    def import_from_csv(self, csv_filename='notes.csv', batch_size=10000, on_conflict='renumber', progress=None):
+        return stream_import(csv_filename, self.csv_to_note, lambda note: self.import_note(note, on_conflict), self.mutation, batch_size, progress)
+
+    def csv_to_note(self, row):
+        note = Note(row['title'], row['content'], row['timestamp'])
+        note.id = optional_int(row.get('id'))
+        return note
+
+    def import_note(self, note, on_conflict='renumber'):
+        status = resolve_id(self.notes, note, self.storage, on_conflict)
+        if status == 'skipped':
+            return status
+        if status == 'replaced':
+            old_note = self.notes[note.id]
+            self.search_index.remove(old_note.id, self.note_text(old_note))
+            self.notes[note.id] = note
+            self.search_index.add(note.id, self.note_text(note))
+            self.storage.update(self.note_to_dict(note))
+        else:
+            self.search_index.add(note.id, self.note_text(note))
+            self.storage.insert(self.note_to_dict(note))
+        return status
 
 def manage_notes(notes_manager: NotesManager) -> None:
+    notes_manager.sync()
     print(texts.NOTES)
     action = input("Выберите действие: ")
     if action == "1":
@@ -112,9 +201,13 @@ def manage_notes(notes_manager: NotesManager) -> None:
         print(notes_manager.view_note_details(note_id))
     elif action == "4":
         note_id = int(input("Введите id заметки: "))
+        version = notes_manager.version(note_id)
         title = input("Введите название: ")
         content = input("Введите содержимое заметки: ")
-        notes_manager.edit_note(note_id, title, content)
+        try:
+            notes_manager.edit_note(note_id, title, content, expected=version)
+        except ConflictError as error:
+            print(error)
     elif action == "5":
         note_id = int(input("Введите id заметки: "))
         notes_manager.delete_note(note_id)
@@ -123,4 +216,12 @@ def manage_notes(notes_manager: NotesManager) -> None:
         notes_manager.export_to_csv(filename)
     elif action == "7":
         filename = input("Введите имя файла: ")
-        notes_manager.import_from_csv(filename)
+        print(format_import_stats(notes_manager.import_from_csv(filename)))
+    elif action == "8":
+        query = input("Введите слова для поиска: ")
+        results = notes_manager.search_notes(query)
+        if results:
+            for note in results:
+                print(f"{note['id']}: {note['title']} ({note['timestamp']})")
+        else:
+            print("Заметки не найдены.")
@@ -0,0 +1,12 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def numpy():
+    # NumPy загружается при первом векторном расчёте, а не при запуске помощника;
+    # без него модули считают обычными циклами
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
@@ -0,0 +1,100 @@
+import functools
+from collections import OrderedDict
+
+QUERY_CACHE_SIZE = 128
+MISSING = object()
+
+
+class QueryCache:
+    # LRU результатов запросов. Записи помечены поколением данных менеджера:
+    # любое добавление, правка, удаление или импорт сдвигают поколение, и кэш очищается целиком
+    def __init__(self, maxsize=QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.generation = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, generation):
+        if generation != self.generation:
+            if self.entries:
+                self.invalidations += 1
+                self.entries.clear()
+            self.generation = generation
+        result = self.entries.get(key, MISSING)
+        if result is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, generation, result):
+        # Данные могли измениться, пока считался результат: такой ответ не запоминаем
+        if generation != self.generation or not self.maxsize:
+            return
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def to_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+        }
+
+
+def freeze(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+def deep_copy(value):
+    # Вложенные списки и словари копируются целиком: отчёт хранит список записей и словарь категорий.
+    # Строки, числа и Decimal неизменяемы и остаются общими, поэтому это быстрее copy.deepcopy
+    if isinstance(value, list):
+        return [deep_copy(item) if isinstance(item, (list, dict)) else item for item in value]
+    if isinstance(value, dict):
+        copied = dict(value)
+        for key, item in value.items():
+            if isinstance(item, (list, dict)):
+                copied[key] = deep_copy(item)
+        return copied
+    return value
+
+
+def cached_query(stamp=None):
+    # Результат метода запоминается по его аргументам; вызывающий получает свою копию результата.
+    # stamp снимает отпечаток внешнего состояния результата, например файла отчёта:
+    # если отпечаток изменился, результат считается заново
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            # sync сдвигает поколение, если данные изменил другой процесс
+            self.sync()
+            generation = self.generation
+            key = (method.__name__, tuple(map(freeze, args)), tuple(sorted((name, freeze(value)) for name, value in kwargs.items())))
+            try:
+                entry = self.query_cache.get(key, generation)
+            except TypeError:
+                # Нехешируемые аргументы, например словарь производных колонок, считаются без кэша
+                return method(self, *args, **kwargs)
+            if entry is MISSING or (stamp is not None and stamp(entry[0]) != entry[1]):
+                result = method(self, *args, **kwargs)
+                entry = (result, stamp(result) if stamp is not None else None)
+                self.query_cache.put(key, generation, entry)
+            return deep_copy(entry[0])
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,137 @@
+import os
+from array import array
+from bisect import bisect_right
+from datetime import date, timedelta
+
+from managers.csvio import write_csv
+from managers.indexes import EPOCH
+from managers.money import from_cents
+from managers.numeric import numpy
+
+# На меньшем числе записей запуск процессов дороже самого расчёта
+PARALLEL_THRESHOLD = 50_000
+PARTITIONS = ('month', 'category')
+
+
+def month_periods(year):
+    # Двенадцать месячных периодов и год целиком
+    year = int(year)
+    starts = [date(year, month, 1) for month in range(1, 13)] + [date(year + 1, 1, 1)]
+    periods = [(start.strftime("%d-%m-%Y"), (end - timedelta(days=1)).strftime("%d-%m-%Y")) for start, end in zip(starts, starts[1:])]
+    return periods + [(f'01-01-{year}', f'31-12-{year}')]
+
+
+def month_starts(first_day, last_day):
+    # Эпохальные дни первых чисел месяцев, покрывающих [first_day, last_day]
+    current = date.fromordinal(first_day + EPOCH).replace(day=1)
+    starts = []
+    while current.toordinal() - EPOCH <= last_day:
+        starts.append(current.toordinal() - EPOCH)
+        current = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+    return starts
+
+
+def partition_columns(columns, partition, first_day, last_day):
+    # Записи отчётного интервала раскладываются по партициям: месяцам или категориям.
+    # Партиция — три колонки: дни, суммы в копейках, коды категорий
+    if partition == 'month':
+        starts = month_starts(first_day, last_day)
+    np = numpy()
+    if np is not None:
+        # array отображается в ndarray без копирования
+        days, amounts, codes = np.asarray(columns.days), np.asarray(columns.amounts), np.asarray(columns.codes)
+        inside = (days >= first_day) & (days <= last_day)
+        days, amounts, codes = days[inside], amounts[inside], codes[inside]
+        keys = np.searchsorted(np.array(starts), days, side='right') if partition == 'month' else codes
+        order = np.argsort(keys, kind='stable')
+        days, amounts, codes, keys = days[order], amounts[order], codes[order], keys[order]
+        bounds = [0, *(np.flatnonzero(np.diff(keys)) + 1).tolist(), len(keys)]
+        return [(days[low:high], amounts[low:high], codes[low:high]) for low, high in zip(bounds, bounds[1:]) if high > low]
+    partitions = {}
+    for day, amount, code in zip(columns.days, columns.amounts, columns.codes):
+        if first_day <= day <= last_day:
+            key = bisect_right(starts, day) if partition == 'month' else code
+            if key not in partitions:
+                partitions[key] = (array('i'), array('q'), array('i'))
+            part_days, part_amounts, part_codes = partitions[key]
+            part_days.append(day)
+            part_amounts.append(amount)
+            part_codes.append(code)
+    return [partitions[key] for key in sorted(partitions)]
+
+
+def aggregate_partition(task):
+    # Частичные итоги одной партиции для каждого периода: доход, расход, число записей, суммы по кодам категорий
+    (days, amounts, codes), periods = task
+    np = numpy()
+    results = []
+    for start_day, end_day in periods:
+        if np is not None:
+            mask = (days >= start_day) & (days <= end_day)
+            selected, selected_codes = amounts[mask], codes[mask]
+            categories = {}
+            if len(selected):
+                present = np.unique(selected_codes)
+                sums = np.zeros(int(present[-1]) + 1, dtype=np.int64)
+                np.add.at(sums, selected_codes, selected)
+                categories = {int(code): int(sums[code]) for code in present}
+            results.append((int(selected[selected > 0].sum()), int(selected[selected < 0].sum()), len(selected), categories))
+            continue
+        income = expense = count = 0
+        categories = {}
+        for day, amount, code in zip(days, amounts, codes):
+            if start_day <= day <= end_day:
+                if amount > 0:
+                    income += amount
+                else:
+                    expense += amount
+                count += 1
+                categories[code] = categories.get(code, 0) + amount
+        results.append((income, expense, count, categories))
+    return results
+
+
+def merge_partials(partials, period_count):
+    merged = [[0, 0, 0, {}] for _ in range(period_count)]
+    for results in partials:
+        for total, (income, expense, count, categories) in zip(merged, results):
+            total[0] += income
+            total[1] += expense
+            total[2] += count
+            for code, amount in categories.items():
+                total[3][code] = total[3].get(code, 0) + amount
+    return merged
+
+
+def write_report(task):
+    # Суммы приходят копейками: целые передаются между процессами быстрее Decimal
+    filename, header, rows, compression = task
+    if 'amount' in header:
+        position = header.index('amount')
+        rows = (row[:position] + (from_cents(row[position]),) + row[position + 1:] for row in rows)
+    write_csv(filename, header, rows, compression)
+    return filename
+
+
+class ReportRunner:
+    # Выполняет задачи в пуле процессов или, для небольших журналов, прямо в текущем процессе
+    def __init__(self, size, workers=None):
+        workers = workers or os.cpu_count() or 1
+        self.executor = None
+        if workers > 1 and size >= PARALLEL_THRESHOLD:
+            # multiprocessing импортируется только для больших журналов
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(workers)
+
+    def map(self, function, tasks):
+        # Пул отправляет все задачи сразу, результаты забираются позже: запись CSV идёт вместе с подсчётом итогов
+        if self.executor is None:
+            return list(map(function, tasks))
+        return self.executor.map(function, tasks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            self.executor.shutdown()
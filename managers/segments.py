@@ -0,0 +1,346 @@
+import gzip
+import json
+import os
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date
+
+from managers.codecs import DECODE_ERRORS, detect_codec
+from managers.indexes import EPOCH, INVALID_DAY, epoch_day, month_key, parse_day
+from managers.instrumentation import count, instrument
+from managers.storage import CorruptStoreError, JournalStore, atomic_write
+
+MANIFEST_FORMAT = 'segments'
+# Записи с некорректной датой хранятся в отдельном сегменте
+UNDATED = 'undated'
+# Сегменты месяцев старше этого числа месяцев от текущего хранятся сжатыми
+COMPRESS_AFTER_MONTHS = 3
+
+
+def month_bounds(name):
+    # 'YYYY-MM' -> первый и последний эпохальный день месяца
+    year, month = map(int, name.split('-'))
+    following = date(year + month // 12, month % 12 + 1, 1)
+    return epoch_day(f'01-{month:02d}-{year}'), following.toordinal() - EPOCH - 1
+
+
+def months_ago(name, today=None):
+    today = today or date.today()
+    year, month = map(int, name.split('-'))
+    return (today.year - year) * 12 + today.month - month
+
+
+class SegmentReader:
+    # Построчное чтение сегментов без загрузки всех записей. Файлы открываются сразу:
+    # сжатие в другом процессе может удалить их, но открытые дескрипторы остаются читаемыми
+    def __init__(self, store, manifest):
+        self.store = store
+        self.files = []
+        self.count = sum(entry['count'] for entry in manifest.values())
+        self.ids = None
+        self.cached = None
+        for name in sorted(manifest):
+            entry = manifest[name]
+            try:
+                file = open(store.segment_path(entry['file']), 'rb')
+            except FileNotFoundError:
+                continue
+            try:
+                ids_file = open(store.segment_path(entry['ids']), 'rb') if 'ids' in entry else None
+            except FileNotFoundError:
+                ids_file = None
+            self.files.append((entry['file'], file, ids_file))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for position in range(len(self.files)):
+            yield from self.segment_rows(position)
+
+    def segment_rows(self, position):
+        filename, file, _ = self.files[position]
+        file.seek(0)
+        return self.store.decode_segment(filename, file.read())
+
+    def get(self, row_id):
+        # Отсортированные id каждого сегмента указывают, какой один сегмент разобрать
+        if self.ids is None:
+            self.ids = [array('q', ids_file.read()) if ids_file is not None else None for _, _, ids_file in self.files]
+            count('bytes_read', sum(len(ids) * ids.itemsize for ids in self.ids if ids is not None))
+        for position, ids in enumerate(self.ids):
+            if ids is not None:
+                found = bisect_left(ids, row_id)
+                if found == len(ids) or ids[found] != row_id:
+                    continue
+            if self.cached is None or self.cached[0] != position:
+                self.cached = (position, {row['id']: row for row in self.segment_rows(position)})
+            row = self.cached[1].get(row_id)
+            if row is not None:
+                return row
+        return None
+
+    def close(self):
+        for _, file, ids_file in self.files:
+            file.close()
+            if ids_file is not None:
+                ids_file.close()
+        self.files = []
+        self.ids = None
+        self.cached = None
+
+
+@instrument
+class SegmentedStore(JournalStore):
+    # Снимок разбит на сегменты по месяцам поля даты. Основной файл хранит манифест:
+    # для каждого сегмента файл, число записей, первый и последний день и итоги по полю сумм.
+    # Журнал остаётся общим, а при сжатии переписываются только сегменты, которых касались операции
+    partitioned = True
+
+    def __init__(self, filename, snapshot, fields, date_field, totals_field=None, range_snapshot=None, migrate_row=None,
+                 compress_after=COMPRESS_AFTER_MONTHS, commit_window=0.0, meta=None, codec=None):
+        super().__init__(filename, snapshot, fields, commit_window=commit_window, meta=meta, codec=codec)
+        self.date_field = date_field
+        self.totals_field = totals_field
+        # range_snapshot(first_day, last_day) отдаёт текущие строки одного месяца из памяти менеджера
+        self.range_snapshot = range_snapshot
+        # migrate_row приводит строку прежнего цельного снимка к текущему набору полей
+        self.migrate_row = migrate_row
+        self.compress_after = compress_after
+        self.segments_dir = filename + '.segments'
+        self.manifest = None
+        self.dirty = set()
+        self.rewrite_all = False
+
+    def segment_of(self, row):
+        day = parse_day(row[self.date_field])
+        return UNDATED if day == INVALID_DAY else month_key(day)
+
+    def segment_path(self, filename):
+        return os.path.join(self.segments_dir, filename)
+
+    def read_file(self):
+        try:
+            with open(self.filename, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def is_manifest(data):
+        return data is not None and data.lstrip()[:1] == b'{'
+
+    def read_manifest(self):
+        data = self.read_file()
+        if not self.is_manifest(data):
+            return {}
+        return json.loads(data)['segments']
+
+    def migrate(self):
+        with self.locked():
+            data = self.read_file()
+            if self.is_manifest(data):
+                return
+            if data is None:
+                rows = self.read_legacy()
+                if rows is None:
+                    return
+            else:
+                # Прежний цельный снимок вместе с журналом раскладывается по сегментам
+                rows = self.replay(super().read_snapshot(), self.read_journal(repair=True)[0])
+                self.meta = self.read_meta()
+                self.generation = self.meta.get('generation', 0)
+                self.next_id = self.meta.get('next_id', 1)
+            if self.migrate_row is not None:
+                rows = list(map(self.migrate_row, rows))
+            self.write_snapshot(rows)
+
+    def read_legacy(self):
+        # Данные из прежнего JSON-файла, цельного или уже разложенного по сегментам, переносятся в формат,
+        # заданный расширением
+        legacy_filename = os.path.splitext(self.filename)[0] + '.json'
+        if legacy_filename == self.filename or not os.path.exists(legacy_filename):
+            return None
+        with open(legacy_filename, 'rb') as file:
+            segmented = self.is_manifest(file.read(64))
+        if segmented:
+            legacy = SegmentedStore(legacy_filename, None, self.fields, self.date_field, self.totals_field)
+        else:
+            legacy = JournalStore(legacy_filename, None, self.fields)
+        rows = legacy.load()
+        self.generation, self.next_id = legacy.generation, legacy.next_id
+        legacy.close()
+        return rows
+
+    def read_snapshot(self):
+        self.manifest = self.read_manifest()
+        self.dirty = set()
+        self.rewrite_all = False
+        rows = []
+        for name in sorted(self.manifest):
+            rows.extend(self.read_segment(self.manifest[name]))
+        return rows
+
+    def read_segment(self, entry):
+        try:
+            with open(self.segment_path(entry['file']), 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            self.rewrite_all = True
+            return []
+        return self.decode_segment(entry['file'], data)
+
+    def decode_segment(self, filename, data):
+        count('bytes_read', len(data))
+        try:
+            if filename.endswith('.gz'):
+                data = gzip.decompress(data)
+            return detect_codec(data).load(data)
+        except DECODE_ERRORS + (OSError,):
+            # Как и повреждённый снимок: без месяца из сегмента сжатие переписало бы данные без него
+            raise CorruptStoreError(self.segment_path(filename)) from None
+
+    def reader(self):
+        if self._reader is None:
+            self.migrate()
+            self._reader = SegmentReader(self, self.read_manifest())
+        return self._reader
+
+    def update(self, row, old=None):
+        self.append({'op': 'update', 'row': row, 'from': self.segment_of(old) if old else None})
+
+    def delete(self, row_id, old=None):
+        self.append({'op': 'delete', 'id': row_id, 'from': self.segment_of(old) if old else None})
+
+    def append(self, op):
+        with self._lock:
+            self.track((op,))
+            super().append(op)
+
+    def track(self, ops):
+        for op in ops:
+            if 'row' in op:
+                self.dirty.add(self.segment_of(op['row']))
+            if op['op'] != 'insert':
+                # Без подсказки неизвестно, в каком сегменте лежала запись: при сжатии переписываются все
+                if op.get('from') is None:
+                    self.rewrite_all = True
+                else:
+                    self.dirty.add(op['from'])
+
+    def needs_compaction(self):
+        # Сжатие переписывает только изменённые сегменты, поэтому порог зависит от их размера, а не всего снимка
+        if self.rewrite_all or self.manifest is None:
+            return super().needs_compaction()
+        dirty_rows = sum(self.manifest[name]['count'] for name in self.dirty if name in self.manifest)
+        return self.pending >= max(self.compact_every, dirty_rows)
+
+    def compact(self):
+        with self.locked():
+            if self.rewrite_all or self.manifest is None or self.range_snapshot is None or UNDATED in self.dirty:
+                self.write_snapshot(self.snapshot())
+                return
+            groups = {name: self.range_snapshot(*month_bounds(name)) for name in sorted(self.dirty)}
+            self.generation += 1
+            self.close_reader()
+            self.write_segments(groups)
+            self.finish_snapshot(sum(entry['count'] for entry in self.manifest.values()))
+        for hook in self.snapshot_hooks:
+            hook()
+
+    def write_rows(self, rows):
+        groups = defaultdict(list)
+        for row in rows:
+            groups[self.segment_of(row)].append(row)
+        self.write_segments(groups, replace=True)
+
+    def write_segments(self, groups, replace=False):
+        # Сегменты пишутся в новые файлы с номером поколения, манифест заменяется последним:
+        # при сбое на полпути старый манифест указывает на целые старые файлы
+        os.makedirs(self.segments_dir, exist_ok=True)
+        manifest = {} if replace else dict(self.manifest or {})
+        for name, rows in groups.items():
+            if rows:
+                manifest[name] = self.write_segment(name, rows)
+            else:
+                manifest.pop(name, None)
+        for name, entry in list(manifest.items()):
+            if name not in groups and self.should_compress(name) and not entry['compressed']:
+                manifest[name] = self.write_segment(name, self.read_segment(entry))
+        document = {'format': MANIFEST_FORMAT, 'date_field': self.date_field, 'segments': manifest}
+        atomic_write(self.filename, lambda file: file.write(json.dumps(document, ensure_ascii=False, indent=1)))
+        self.manifest = manifest
+        self.dirty = set()
+        self.rewrite_all = False
+        self.remove_unused(manifest)
+
+    def should_compress(self, name):
+        return name != UNDATED and self.compress_after is not None and months_ago(name) > self.compress_after
+
+    def write_segment(self, name, rows):
+        compressed = self.should_compress(name)
+        filename = f'{name}.{self.generation}.seg' + ('.gz' if compressed else '')
+
+        def dump(file):
+            if not compressed:
+                self.codec.write(file, rows, self.fields)
+                return
+            with gzip.GzipFile(fileobj=file, mode='wb', mtime=0) as stream:
+                self.codec.write(stream, rows, self.fields)
+
+        atomic_write(self.segment_path(filename), dump, 'wb')
+        ids = array('q', sorted(row['id'] for row in rows))
+        atomic_write(self.segment_path(filename + '.ids'), lambda file: file.write(ids.tobytes()), 'wb')
+        days = [day for day in (parse_day(row[self.date_field]) for row in rows) if day != INVALID_DAY]
+        entry = {
+            'file': filename,
+            'ids': filename + '.ids',
+            'count': len(rows),
+            'compressed': compressed,
+            'first_day': min(days, default=None),
+            'last_day': max(days, default=None),
+        }
+        if self.totals_field:
+            amounts = [row[self.totals_field] for row in rows]
+            entry['income'] = sum(amount for amount in amounts if amount > 0)
+            entry['expense'] = sum(amount for amount in amounts if amount < 0)
+        return entry
+
+    def remove_unused(self, manifest):
+        used = {entry['file'] for entry in manifest.values()} | {entry.get('ids') for entry in manifest.values()}
+        for filename in os.listdir(self.segments_dir):
+            if filename not in used and not filename.endswith('.corrupt'):
+                try:
+                    os.remove(self.segment_path(filename))
+                except FileNotFoundError:
+                    pass
+
+    def rows_between(self, first_day=None, last_day=None):
+        # Выборка по датам без загрузки всего снимка: читаются только сегменты, пересекающие диапазон,
+        # поверх них накладываются операции журнала
+        low = INVALID_DAY + 1 if first_day is None else first_day
+        high = 2 ** 31 - 1 if last_day is None else last_day
+        with self.locked():
+            self.migrate()
+            manifest = self.read_manifest()
+            overlay = {}
+            for op in self.read_journal()[0] + [json.loads(line) for line in self._buffer]:
+                if op['op'] == 'delete':
+                    overlay[op['id']] = None
+                else:
+                    overlay[op['row']['id']] = op['row']
+            rows = []
+            for name in sorted(manifest):
+                entry = manifest[name]
+                if entry['first_day'] is None or entry['last_day'] < low or entry['first_day'] > high:
+                    continue
+                rows.extend(row for row in self.read_segment(entry) if row['id'] not in overlay)
+        rows.extend(row for row in overlay.values() if row is not None)
+        found = []
+        for row in rows:
+            day = parse_day(row[self.date_field])
+            if day != INVALID_DAY and low <= day <= high:
+                found.append((day, row['id'], row))
+        found.sort(key=lambda item: item[:2])
+        return [row for _, _, row in found]
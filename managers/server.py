@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import inspect
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from managers.calc import Calculator
+from managers.contacts import Contact, ContactsManager
+from managers.finances import FinanceManager, FinanceRecord
+from managers.instrumentation import DUMP_INTERVAL, enable, profiled
+from managers.notes import Note, NotesManager
+from managers.tasks import Task, TaskManager
+
+# Раздел: (класс, файл по умолчанию, методы, доступные клиентам)
+SECTIONS = {
+    'notes': (NotesManager, 'notes.json', {
+        'create_note', 'view_notes', 'view_note_details', 'get_note_by_id', 'edit_note', 'delete_note',
+        'search_notes', 'export_to_csv', 'import_from_csv', 'save_notes', 'version', 'stats',
+    }),
+    'tasks': (TaskManager, 'tasks.json', {
+        'add_task', 'view_tasks', 'get_task_by_id', 'mark_task_done', 'edit_task', 'delete_task',
+        'filter_tasks', 'export_to_csv', 'import_from_csv', 'save_tasks', 'version', 'stats',
+    }),
+    'contacts': (ContactsManager, 'contacts.json', {
+        'add_contact', 'search_contact', 'get_contact_by_id', 'edit_contact', 'delete_contact',
+        'export_to_csv', 'import_from_csv', 'save_contacts', 'version', 'stats',
+    }),
+    'finances': (FinanceManager, 'finance.json', {
+        'add_record', 'get_record_by_id', 'edit_record', 'delete_record', 'view_records', 'filter_records',
+        'generate_report', 'generate_reports', 'evaluate_column', 'export_to_csv', 'import_from_csv', 'calculate_balance',
+        'group_by_category', 'group_by_month', 'save_records', 'version', 'stats',
+    }),
+    'calc': (Calculator, None, {'evaluate', 'evaluate_many', 'calculate'}),
+}
+# Строка запроса может нести целые колонки значений для evaluate_many
+LINE_LIMIT = 2 ** 24
+COMMIT_WINDOW = 0.01
+# Параметры методов с именами файлов: клиент сокета может указать только файл внутри data_dir
+PATH_PARAMETERS = {'csv_filename'}
+OUTSIDE_DATA_DIR = "Ошибка: путь к файлу должен быть относительным и не выходить за каталог данных."
+# Калькулятор общий для всех клиентов: расчёты идут в отдельном пуле и ограничены по времени
+CALC_WORKERS = 4
+CALC_TIMEOUT = 10.0
+
+
+class AssistantService:
+    # Один набор менеджеров на всех клиентов. Каждый менеджер работает в своём потоке:
+    # вызовы к нему идут по очереди, а запись на диск не останавливает цикл событий
+    def __init__(self, data_dir='.', commit_window=COMMIT_WINDOW, calc_timeout=CALC_TIMEOUT):
+        self.data_dir = data_dir
+        self.commit_window = commit_window
+        self.calc_timeout = calc_timeout
+        self.managers = {}
+        self.executors = {}
+        self.calc_executor = ThreadPoolExecutor(CALC_WORKERS, thread_name_prefix='calc')
+        self.encoders = {
+            Note: lambda note: self.manager('notes').note_to_dict(note),
+            Task: lambda task: self.manager('tasks').task_to_dict(task),
+            Contact: lambda contact: self.manager('contacts').contact_to_dict(contact),
+            FinanceRecord: lambda record: self.manager('finances').record_to_dict(record),
+            # Сумма передаётся строкой, чтобы не терять копейки в float
+            Decimal: str,
+        }
+
+    def manager(self, section):
+        if section not in self.managers:
+            factory, filename, _ = SECTIONS[section]
+            if filename is None:
+                self.managers[section] = factory()
+            else:
+                self.managers[section] = factory(os.path.join(self.data_dir, filename), self.commit_window)
+                self.executors[section] = ThreadPoolExecutor(1, thread_name_prefix=section)
+        return self.managers[section]
+
+    def call(self, section, method, args, kwargs):
+        manager = self.manager(section)
+        if hasattr(manager, 'sync'):
+            manager.sync()
+        return getattr(manager, method)(*args, **kwargs)
+
+    def submit(self, line):
+        # Возвращает future с готовой строкой ответа; порядок вызовов внутри раздела сохраняется
+        loop = asyncio.get_running_loop()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            section, method = request['section'], request['method']
+            if section not in SECTIONS or method not in SECTIONS[section][2]:
+                raise ValueError(f"Ошибка: неизвестный метод {section}.{method}.")
+            args, kwargs = self.client_paths(section, method, request.get('args', []), request.get('params', {}))
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            message = str(error) if str(error).startswith("Ошибка") else "Ошибка: некорректный запрос."
+            future = loop.create_future()
+            future.set_result(self.encode({'id': request_id, 'error': message}))
+            return future
+        self.manager(section)
+        executor = self.executors.get(section)
+        if executor is None:
+            return asyncio.ensure_future(self.respond_in_time(request_id, section, method, args, kwargs))
+        return loop.run_in_executor(executor, self.respond, request_id, section, method, args, kwargs)
+
+    def client_paths(self, section, method, args, kwargs):
+        # Имена файлов от клиента, в том числе значения по умолчанию, разрешаются внутри data_dir
+        function = getattr(self.manager(section), method)
+        if not PATH_PARAMETERS.intersection(inspect.signature(function).parameters):
+            return args, kwargs
+        try:
+            bound = inspect.signature(function).bind(*args, **kwargs)
+        except TypeError:
+            raise ValueError(f"Ошибка: неверные аргументы метода {section}.{method}.") from None
+        bound.apply_defaults()
+        for name in PATH_PARAMETERS.intersection(bound.arguments):
+            bound.arguments[name] = self.resolve_path(bound.arguments[name])
+        return bound.args, bound.kwargs
+
+    def resolve_path(self, filename):
+        if not isinstance(filename, str) or not filename or os.path.isabs(filename) or '..' in filename.replace('\\', '/').split('/'):
+            raise ValueError(OUTSIDE_DATA_DIR)
+        root = os.path.realpath(self.data_dir)
+        path = os.path.realpath(os.path.join(root, filename))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(OUTSIDE_DATA_DIR)
+        return path
+
+    async def respond_in_time(self, request_id, section, method, args, kwargs):
+        # Долгое выражение не держит цикл событий; по истечении времени клиент получает ошибку,
+        # а поток пула досчитывает выражение впустую
+        future = asyncio.get_running_loop().run_in_executor(self.calc_executor, self.respond, request_id, section, method, args, kwargs)
+        try:
+            return await asyncio.wait_for(future, self.calc_timeout)
+        except asyncio.TimeoutError:
+            return self.encode({'id': request_id, 'error': f"Ошибка: вычисление не уложилось в {self.calc_timeout:g} с."})
+
+    def respond(self, request_id, section, method, args, kwargs):
+        try:
+            return self.encode({'id': request_id, 'result': self.call(section, method, args, kwargs)})
+        except Exception as error:
+            return self.encode({'id': request_id, 'error': self.message(error)})
+
+    @staticmethod
+    def message(error):
+        text = str(error)
+        return text if text.startswith("Ошибка") else f"Ошибка: {type(error).__name__}: {text}"
+
+    def encode(self, response):
+        return json.dumps(response, ensure_ascii=False, default=self.default).encode() + b'\n'
+
+    def default(self, value):
+        encoder = self.encoders.get(type(value))
+        if encoder is not None:
+            return encoder(value)
+        if isinstance(value, (tuple, set, frozenset)):
+            return list(value)
+        raise TypeError(f"значение типа {type(value).__name__} не сериализуется")
+
+    async def client(self, reader, writer):
+        # Клиент может слать запросы, не дожидаясь ответов; ответы уходят в порядке запросов
+        pending = asyncio.Queue()
+
+        async def write_responses():
+            while True:
+                future = await pending.get()
+                if future is None:
+                    return
+                writer.write(await future)
+                if pending.empty():
+                    await writer.drain()
+
+        writing = asyncio.create_task(write_responses())
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    await pending.put(self.submit(line))
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            await pending.put(None)
+            try:
+                await writing
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+
+    def close(self):
+        self.calc_executor.shutdown(wait=False, cancel_futures=True)
+        for executor in self.executors.values():
+            executor.shutdown()
+        for manager in self.managers.values():
+            storage = getattr(manager, 'storage', None)
+            if storage is not None:
+                storage.flush()
+
+
+async def serve(service, socket_path=None, host='127.0.0.1', port=8765):
+    if socket_path:
+        server = await asyncio.start_unix_server(service.client, socket_path, limit=LINE_LIMIT)
+    else:
+        server = await asyncio.start_server(service.client, host, port, limit=LINE_LIMIT)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сервер персонального помощника: запросы JSON построчно")
+    parser.add_argument('--socket', help="путь к Unix-сокету вместо TCP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--data-dir', default='.', help="каталог с файлами менеджеров")
+    parser.add_argument('--commit-window', type=float, default=COMMIT_WINDOW, help="окно группового fsync, секунды")
+    parser.add_argument('--calc-timeout', type=float, default=CALC_TIMEOUT, help="предел времени одного расчёта калькулятора, секунды")
+    parser.add_argument('--stats', metavar='FILE', help="периодически записывать замеры методов в JSON-файл")
+    parser.add_argument('--stats-interval', type=float, default=DUMP_INTERVAL, help="период записи замеров, секунды")
+    parser.add_argument('--profile', metavar='DIR', help="сохранить профиль cProfile сеанса в каталог")
+    options = parser.parse_args(argv)
+    if options.stats:
+        enable(options.stats, options.stats_interval)
+    service = AssistantService(options.data_dir, options.commit_window, options.calc_timeout)
+    try:
+        with profiled(options.profile):
+            asyncio.run(serve(service, options.socket, options.host, options.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    # python -m managers.server [--socket путь | --port N]
+    main()
@@ -0,0 +1,948 @@
+import atexit
+import json
+import mmap
+import os
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from managers.codecs import DECODE_ERRORS, codec_for, detect_codec
+from managers.instrumentation import count, instrument, owner_stats
+from managers.querycache import QUERY_CACHE_SIZE, QueryCache
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CONFLICT = "Ошибка: запись изменена другим процессом. Повторите редактирование."
+# Столько последних изменений SQLite-хранилища держится в журнале для других процессов
+CHANGE_LOG_LIMIT = 10000
+
+
+class ConflictError(ValueError):
+    pass
+
+
+class CorruptStoreError(ValueError):
+    # Повреждённый файл данных не заменяется пустым хранилищем: пока файл не исправлен
+    # или не убран, менеджер не загружается и не принимает изменений
+    def __init__(self, filename):
+        super().__init__(f"Ошибка: файл {filename} повреждён и не может быть прочитан. Исправьте его или переименуйте, чтобы начать с пустыми данными.")
+        self.filename = filename
+
+
+def file_stamp(filename):
+    # Снимок заменяется через os.replace, поэтому новый файл виден по смене inode
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return ()
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def fsync_directory(filename):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(filename, dump, mode='w'):
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, mode) as file:
+        dump(file)
+        file.flush()
+        count('bytes_written', os.fstat(file.fileno()).st_size)
+        os.fsync(file.fileno())
+    os.replace(tmp_filename, filename)
+    fsync_directory(filename)
+
+
+def write_offsets(filename, ids, offsets):
+    stat = os.stat(filename)
+    order = sorted(range(len(ids)), key=ids.__getitem__)
+    table = array('q', [stat.st_size, stat.st_mtime_ns, len(ids)])
+    table.extend(ids[i] for i in order)
+    table.extend(offsets[i] for i in order)
+    atomic_write(filename + '.offsets', table.tofile, 'wb')
+
+
+class SnapshotReader:
+    def __init__(self, filename):
+        self.filename = filename
+        self.rows = None
+        self.ids = self.offsets = None
+        self.codec = self.fields = None
+        self._file = None
+        self._map = None
+        self._table = None
+        self._table_map = None
+        try:
+            self._file = open(filename, 'rb')
+        except FileNotFoundError:
+            self.rows, self.by_id = [], {}
+            return
+        stat = os.fstat(self._file.fileno())
+        if stat.st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map is not None:
+            self.codec = detect_codec(self._map)
+            header = self.codec.header(self._map)
+        if self._map is None or header is None:
+            # Снимок старого формата целиком в одну строку
+            self.rows = self.codec.load(self._map[:]) if self._map is not None else []
+            self.by_id = {}
+            for row in self.rows:
+                self.by_id.setdefault(row['id'], row)
+            self.close()
+            return
+        self.fields, self.body = header
+        if not self.read_offsets(stat):
+            self.ids, self.offsets = self.scan_offsets()
+
+    def read_offsets(self, stat):
+        try:
+            with open(self.filename + '.offsets', 'rb') as file:
+                self._table_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._table = memoryview(self._table_map).cast('q')
+        except (FileNotFoundError, TypeError, ValueError):
+            self.close_offsets()
+            return False
+        table = self._table
+        if len(table) < 3 or table[0] != stat.st_size or table[1] != stat.st_mtime_ns or len(table) != 3 + 2 * table[2]:
+            self.close_offsets()
+            return False
+        count = table[2]
+        self.ids, self.offsets = table[3:3 + count], table[3 + count:]
+        return True
+
+    def close_offsets(self):
+        for view in (self.ids, self.offsets, self._table):
+            if isinstance(view, memoryview):
+                view.release()
+        self.ids = self.offsets = self._table = None
+        if self._table_map is not None:
+            self._table_map.close()
+            self._table_map = None
+
+    def scan_offsets(self):
+        pairs = []
+        for position, row in self.lines():
+            pairs.append((row['id'], position))
+        pairs.sort()
+        return array('q', [row_id for row_id, _ in pairs]), array('q', [position for _, position in pairs])
+
+    def lines(self):
+        return self.codec.rows(self._map, self.fields, self.body)
+
+    def __len__(self):
+        return len(self.rows) if self.rows is not None else len(self.ids)
+
+    def __iter__(self):
+        if self.rows is not None:
+            return iter(self.rows)
+        return (row for _, row in self.lines())
+
+    def get(self, row_id):
+        if self.rows is not None:
+            return self.by_id.get(row_id)
+        position = bisect_left(self.ids, row_id)
+        if position == len(self.ids) or self.ids[position] != row_id:
+            return None
+        return self.codec.row_at(self._map, self.offsets[position], self.fields)
+
+    def close(self):
+        self.close_offsets()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+
+def open_store(filename, snapshot, table, fields, indexes=None, commit_window=0.0, meta=None, codec=None):
+    if filename.endswith(SQLITE_SUFFIXES):
+        return SQLiteStore(filename, snapshot, table, fields, indexes, commit_window, meta)
+    return JournalStore(filename, snapshot, fields, commit_window=commit_window, meta=meta, codec=codec)
+
+
+def claim_id(index, record, store):
+    renumbered = record.id is None or record.id in index
+    if renumbered:
+        record.id = store.next_id
+    store.next_id = max(store.next_id, record.id + 1)
+    index[record.id] = record
+    return renumbered
+
+
+def resolve_id(index, record, store, on_conflict='renumber'):
+    if on_conflict not in ('renumber', 'skip', 'replace'):
+        raise ValueError("Ошибка: неизвестный режим конфликта id. Используйте renumber, skip или replace.")
+    conflict = record.id is not None and record.id in index
+    if conflict and on_conflict == 'skip':
+        return 'skipped'
+    if conflict and on_conflict == 'replace':
+        return 'replaced'
+    claim_id(index, record, store)
+    return 'renumbered' if conflict else 'imported'
+
+
+def index_by_id(records, store):
+    index = {}
+    renumbered = False
+    for record in records:
+        # Дубликаты id могли остаться от импорта CSV в старых версиях
+        renumbered = claim_id(index, record, store) or renumbered
+    return index, renumbered
+
+
+class LazyManager:
+    # Менеджер читает данные с диска при первом обращении к ним, а не в конструкторе
+    lazy_fields = ()
+    # Поколение данных в памяти: растёт при каждом изменении, своём или другого процесса
+    generation = 0
+    query_cache_size = QUERY_CACHE_SIZE
+
+    def __getattr__(self, name):
+        if name not in self.lazy_fields or self.__dict__.get('loading'):
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        self.ensure_loaded()
+        return self.__dict__[name]
+
+    @property
+    def loaded(self):
+        return self.lazy_fields[0] in self.__dict__
+
+    def ensure_loaded(self):
+        if self.loaded or self.__dict__.get('loading'):
+            return
+        self.loading = True
+        try:
+            with self.storage.locked():
+                self.load()
+        finally:
+            self.loading = False
+
+    def reload(self):
+        for name in self.lazy_fields:
+            self.__dict__.pop(name, None)
+        self.generation += 1
+        self.ensure_loaded()
+
+    @property
+    def query_cache(self):
+        cache = self.__dict__.get('_query_cache')
+        if cache is None:
+            cache = self._query_cache = QueryCache(self.query_cache_size)
+        return cache
+
+    def sync(self):
+        # Дешёвая проверка хранилища: изменения других процессов применяются по одной записи,
+        # полная перезагрузка нужна, только если кто-то переписал снимок
+        changes = self.storage.changes()
+        if changes != []:
+            self.generation += 1
+        if not self.loaded:
+            return
+        if changes is None:
+            self.reload()
+            return
+        for row_id, row in changes:
+            self.apply_row(row_id, row)
+
+    def version(self, row_id):
+        # Содержимое записи на момент чтения; передаётся в правку как expected
+        self.sync()
+        return self.current_row(row_id)
+
+    @contextmanager
+    def transaction(self):
+        # Все изменения внутри сбрасываются на диск один раз; при ошибке не записанное отменяется,
+        # а память перечитывается с диска
+        with self.storage.locked():
+            self.sync()
+            try:
+                yield self
+            except BaseException:
+                self.storage.rollback()
+                if self.loaded:
+                    self.reload()
+                raise
+
+    def stats(self):
+        # Замеры методов менеджера и его хранилища; пусто, пока замеры не включены
+        return dict(owner_stats(self, self.storage), query_cache=self.query_cache.to_dict())
+
+    @contextmanager
+    def mutation(self, row_id=None, expected=None):
+        with self.storage.locked():
+            self.sync()
+            if expected is not None and self.current_row(row_id) != expected:
+                raise ConflictError(CONFLICT)
+            try:
+                yield
+            finally:
+                self.generation += 1
+
+
+def date_key(column):
+    # Ключ DD-MM-YYYY -> YYYYMMDD, чтобы индекс по дате поддерживал диапазоны
+    return f"substr({column}, 7, 4) || substr({column}, 4, 2) || substr({column}, 1, 2)"
+
+
+def valid_date(column):
+    return f"{column} GLOB '[0-9][0-9]-[0-9][0-9]-[0-9][0-9][0-9][0-9]'"
+
+
+def unicode_lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+@instrument
+class JournalStore:
+    indexed = False
+    partitioned = False
+
+    def __init__(self, filename, snapshot, fields, compact_every=1000, commit_window=0.0, meta=None, codec=None):
+        self.filename = filename
+        self.fields = fields
+        self.codec = codec_for(filename, codec)
+        self.journal_filename = filename + '.journal'
+        self.meta_filename = filename + '.meta'
+        self.lock_filename = filename + '.lock'
+        self.snapshot = snapshot
+        self.meta_source = meta
+        self.meta = {}
+        self.meta_current = False
+        self.snapshot_hooks = []
+        self.generation = 0
+        self.next_id = 1
+        self.compact_every = compact_every
+        self.commit_window = commit_window
+        self.pending = 0
+        self.snapshot_rows = 0
+        self.syncs = 0
+        # Какой снимок и сколько байт журнала уже отражены в памяти; None — данные ещё не читались
+        self.snapshot_stamp = None
+        self.journal_size = 0
+        self._journal = None
+        self._reader = None
+        self._overlay = None
+        self._buffer = []
+        self._unsynced = False
+        self._lock_file = None
+        self._lock_depth = 0
+        self._fresh = False
+        self._timer = None
+        self._lock = threading.RLock()
+        if commit_window:
+            atexit.register(self.flush)
+
+    def load(self):
+        with self.locked():
+            self.migrate()
+            self.snapshot_stamp = file_stamp(self.filename)
+            rows = self.read_snapshot()
+            ops, self.journal_size = self.read_journal(repair=True)
+            self.meta = self.read_meta()
+            self.track(ops)
+        self.pending = len(ops)
+        self.snapshot_rows = len(rows)
+        # Метаданные пишутся вместе со снимком и устаревают после операций в журнале
+        self.meta_current = not ops
+        self.generation = self.meta.get('generation', 0) + len(ops)
+        self.next_id = max(
+            self.meta.get('next_id', 1),
+            max((row['id'] for row in rows), default=0) + 1,
+            max((op['row']['id'] for op in ops if op['op'] == 'insert'), default=0) + 1,
+        )
+        return self.replay(rows, ops) if ops else rows
+
+    def track(self, ops):
+        # Операции журнала, которые ещё не вошли в снимок; хранилище с сегментами отмечает по ним изменённые сегменты
+        pass
+
+    def read_meta(self):
+        try:
+            with open(self.meta_filename, 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def read_snapshot(self):
+        try:
+            with open(self.filename, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return []
+        count('bytes_read', len(data))
+        if not data:
+            return []
+        codec = detect_codec(data)
+        try:
+            return codec.load(data)
+        except DECODE_ERRORS:
+            raise CorruptStoreError(self.filename) from None
+
+    def migrate(self):
+        # Данные из прежнего JSON-файла переносятся в формат, заданный расширением
+        legacy_filename = os.path.splitext(self.filename)[0] + '.json'
+        if legacy_filename == self.filename or os.path.exists(self.filename) or not os.path.exists(legacy_filename):
+            return
+        legacy = JournalStore(legacy_filename, None, self.fields)
+        rows = legacy.load()
+        self.generation, self.next_id = legacy.generation, legacy.next_id
+        legacy.close()
+        self.write_snapshot(rows)
+
+    def read_journal(self, start=0, repair=False):
+        ops = []
+        valid = start
+        try:
+            with open(self.journal_filename, 'rb') as file:
+                file.seek(start)
+                for line in file:
+                    # Недописанная последняя строка — след сбоя во время записи
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        ops.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+                    valid += len(line)
+                size = file.seek(0, os.SEEK_END)
+        except FileNotFoundError:
+            return ops, 0
+        count('bytes_read', valid - start)
+        # Обрезать хвост можно только под блокировкой: иначе это может быть чужая запись в процессе
+        if repair and size != valid:
+            with open(self.journal_filename, 'r+b') as file:
+                file.truncate(valid)
+        return ops, valid
+
+    def changes(self):
+        with self._lock:
+            # Под уже проверенной блокировкой чужих изменений появиться не может
+            if self._fresh:
+                return []
+            self._fresh = self._lock_depth > 0
+            if self.snapshot_stamp is None:
+                # Память ещё не загружена: запоминаем текущее состояние файлов вместо полной перезагрузки.
+                # Если что-то уже читалось без загрузки, это могло быть прежнее состояние — сообщаем о перезаписи
+                read = self._reader is not None or self._overlay is not None
+                self.close_reader()
+                self.snapshot_stamp = file_stamp(self.filename)
+                try:
+                    self.journal_size = os.path.getsize(self.journal_filename)
+                except FileNotFoundError:
+                    self.journal_size = 0
+                return None if read else []
+            if file_stamp(self.filename) != self.snapshot_stamp:
+                self.close_reader()
+                return None
+            try:
+                size = os.path.getsize(self.journal_filename)
+            except FileNotFoundError:
+                size = 0
+            if size == self.journal_size:
+                return []
+            if size < self.journal_size:
+                self.close_reader()
+                return None
+            ops, self.journal_size = self.read_journal(self.journal_size)
+            if not ops:
+                return []
+            self.track(ops)
+            self._overlay = None
+            self.pending += len(ops)
+            self.generation += len(ops)
+            self.meta_current = False
+            changes = []
+            for op in ops:
+                if op['op'] == 'delete':
+                    changes.append((op['id'], None))
+                else:
+                    changes.append((op['row']['id'], op['row']))
+                    self.next_id = max(self.next_id, op['row']['id'] + 1)
+            return changes
+
+    @staticmethod
+    def replay(rows, ops):
+        rows = list(rows)
+        positions = defaultdict(list)
+        for i, row in enumerate(rows):
+            positions[row['id']].append(i)
+        for op in ops:
+            kind = op['op']
+            if kind == 'delete':
+                for i in positions.pop(op['id'], ()):
+                    rows[i] = None
+                continue
+            row = op['row']
+            found = positions.get(row['id'])
+            # Повторное применение операции после сбоя не должно дублировать записи
+            if found:
+                rows[found[0]] = row
+            elif kind == 'insert':
+                positions[row['id']].append(len(rows))
+                rows.append(row)
+        return [row for row in rows if row is not None]
+
+    def reader(self):
+        if self._reader is None:
+            self.migrate()
+            try:
+                self._reader = SnapshotReader(self.filename)
+            except DECODE_ERRORS:
+                raise CorruptStoreError(self.filename) from None
+        return self._reader
+
+    def journal_overlay(self):
+        with self._lock:
+            if self._overlay is None:
+                reader = self.reader()
+                overlay = {}
+                # Операции из буфера ещё не в файле, если чтение идёт внутри блокировки
+                for op in self.read_journal()[0] + [json.loads(line) for line in self._buffer]:
+                    if op['op'] == 'delete':
+                        overlay[op['id']] = None
+                        continue
+                    row = op['row']
+                    exists = overlay[row['id']] is not None if row['id'] in overlay else reader.get(row['id']) is not None
+                    if exists or op['op'] == 'insert':
+                        overlay[row['id']] = row
+                self._overlay = overlay
+            return self._overlay
+
+    def get(self, row_id):
+        # Чтение одной записи без загрузки всего снимка в память
+        overlay = self.journal_overlay()
+        if row_id in overlay:
+            return overlay[row_id]
+        return self.reader().get(row_id)
+
+    def iter_rows(self):
+        overlay = dict(self.journal_overlay())
+        for row in self.reader():
+            if row['id'] in overlay:
+                row = overlay.pop(row['id'])
+                if row is None:
+                    continue
+            yield row
+        yield from (row for row in overlay.values() if row is not None)
+
+    def insert(self, row):
+        self.next_id = max(self.next_id, row['id'] + 1)
+        self.append({'op': 'insert', 'row': row})
+
+    # old — прежнее содержимое записи; нужно только хранилищу с сегментами, чтобы знать, какой сегмент затронут
+    def update(self, row, old=None):
+        self.append({'op': 'update', 'row': row})
+
+    def delete(self, row_id, old=None):
+        self.append({'op': 'delete', 'id': row_id})
+
+    def append(self, op):
+        with self._lock:
+            self._buffer.append(json.dumps(op, ensure_ascii=False) + '\n')
+            self._overlay = None
+            self.pending += 1
+            self.generation += 1
+            if self._lock_depth:
+                return
+            if self.needs_compaction():
+                self.compact()
+            elif not self.commit_window:
+                self.flush()
+            else:
+                self._flush_later()
+
+    def needs_compaction(self):
+        # Порог растёт вместе со снимком, чтобы перезапись оставалась амортизированно O(1)
+        return self.pending >= max(self.compact_every, self.snapshot_rows)
+
+    def _flush_later(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.commit_window, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @contextmanager
+    def locked(self):
+        # Рекомендательная блокировка fcntl на отдельном файле: снимок заменяется через os.replace,
+        # а журнал обрезается при сжатии, поэтому их собственные дескрипторы не подходят
+        with self._lock:
+            if not self._lock_depth:
+                self._acquire()
+            self._lock_depth += 1
+            try:
+                yield self
+                # Сжатие откладывается до конца операции, чтобы снимок не разрезал транзакцию
+                if self._lock_depth == 1 and self._buffer and self.needs_compaction():
+                    self.compact()
+            finally:
+                self._lock_depth -= 1
+                if not self._lock_depth:
+                    self._fresh = False
+                    try:
+                        # Буфер уходит в журнал до снятия блокировки, иначе чужие операции встанут раньше наших
+                        self._write_buffer()
+                    finally:
+                        self._release()
+                    if self._unsynced and not self.commit_window:
+                        self.flush()
+                    elif self._unsynced:
+                        self._flush_later()
+
+    def batch(self):
+        return self.locked()
+
+    def rollback(self):
+        # Отмена операций, ещё не записанных в журнал; память менеджер перечитывает сам
+        with self._lock:
+            self._buffer.clear()
+            self._overlay = None
+            self._fresh = False
+            self.snapshot_stamp = None
+
+    def _acquire(self):
+        if fcntl is None:
+            return
+        if self._lock_file is None:
+            self._lock_file = open(self.lock_filename, 'a')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+
+    def _release(self):
+        if fcntl is not None and self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _write_buffer(self):
+        if not self._buffer:
+            return
+        data = ''.join(self._buffer).encode()
+        if self._journal is None:
+            self._journal = open(self.journal_filename, 'ab')
+        # Если журнал дописан кем-то ещё, позиция не сдвигается: чужие операции прочитает changes()
+        current = os.fstat(self._journal.fileno()).st_size == self.journal_size
+        self._journal.write(data)
+        self._journal.flush()
+        count('bytes_written', len(data))
+        if current:
+            self.journal_size += len(data)
+        self._buffer.clear()
+        self._unsynced = True
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._buffer and not self._lock_depth:
+                self._acquire()
+                try:
+                    self._write_buffer()
+                finally:
+                    self._release()
+            else:
+                self._write_buffer()
+            if self._unsynced:
+                os.fsync(self._journal.fileno())
+                self._unsynced = False
+                self.syncs += 1
+
+    def compact(self):
+        with self.locked():
+            self.write_snapshot(self.snapshot())
+
+    def write_snapshot(self, rows):
+        with self.locked():
+            self.next_id = max(self.next_id, max((row['id'] for row in rows), default=0) + 1)
+            self.generation += 1
+            self.close_reader()
+            self.write_rows(rows)
+            self.finish_snapshot(len(rows))
+        for hook in self.snapshot_hooks:
+            hook()
+
+    def write_rows(self, rows):
+        offsets = []
+        atomic_write(self.filename, lambda file: offsets.extend(self.codec.write(file, rows, self.fields)), 'wb')
+        write_offsets(self.filename, *offsets)
+
+    def finish_snapshot(self, row_count):
+        # Снимок записан: метаданные обновляются, журнал обнуляется
+        with self.locked():
+            meta = dict(self.meta_source() if self.meta_source else {}, next_id=self.next_id, generation=self.generation)
+            atomic_write(self.meta_filename, lambda file: file.write(json.dumps(meta)))
+            self._buffer.clear()
+            self._unsynced = False
+            self.close()
+            with open(self.journal_filename, 'w'):
+                pass
+            self.snapshot_stamp = file_stamp(self.filename)
+            self.journal_size = 0
+            self.pending = 0
+            self.snapshot_rows = row_count
+            self.syncs += 1
+
+    def close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        self._overlay = None
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            self.close_reader()
+
+
+@instrument
+class SQLiteStore:
+    indexed = True
+    partitioned = False
+
+    def __init__(self, filename, snapshot, table, fields, indexes=None, commit_window=0.0, meta=None):
+        self.filename = filename
+        self.snapshot = snapshot
+        self.meta_source = meta
+        self.meta = {}
+        self.meta_current = True
+        self.snapshot_hooks = []
+        self.generation = 0
+        self.table = table
+        self.fields = fields
+        self.next_id = 1
+        self.commit_window = commit_window
+        self.syncs = 0
+        self._dirty = False
+        self._batch_depth = 0
+        self._fresh = False
+        self._timer = None
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(filename, isolation_level=None, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.create_function('unicode_lower', 1, unicode_lower, deterministic=True)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        columns = ', '.join(['id INTEGER PRIMARY KEY'] + [field for field in fields if field != 'id'])
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {table}_meta (key TEXT PRIMARY KEY, value)')
+        for name, expression in (indexes or {}).items():
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_{name} ON {table} ({expression})')
+        # Журнал изменённых id заполняют триггеры: другие процессы читают из него только новые записи
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {table}_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, id INTEGER)')
+        for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+            self.connection.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {table}_log_{event.lower()} AFTER {event} ON {table} '
+                f'BEGIN INSERT INTO {table}_log (id) VALUES ({row}.id); END'
+            )
+        self.data_version = self.connection.execute('PRAGMA data_version').fetchone()[0]
+        self.log_seq = self.last_seq()
+        self._insert_sql = f'INSERT OR REPLACE INTO {table} ({", ".join(fields)}) VALUES ({", ".join("?" * len(fields))})'
+        if commit_window:
+            atexit.register(self.flush)
+
+    def add_column(self, name, fill=None):
+        # Столбец, которого не было в старой таблице; fill — выражение SQL для уже сохранённых строк
+        columns = {row[1] for row in self.connection.execute(f'PRAGMA table_info({self.table})')}
+        if name in columns:
+            return False
+        with self._lock:
+            self.connection.execute(f'ALTER TABLE {self.table} ADD COLUMN {name}')
+            if fill:
+                self.connection.execute(f'UPDATE {self.table} SET {name} = {fill}')
+        return True
+
+    def load(self):
+        self.meta = {
+            key: json.loads(value) if isinstance(value, str) else value
+            for key, value in self.connection.execute(f'SELECT key, value FROM {self.table}_meta')
+        }
+        max_id = self.connection.execute(f'SELECT max(id) FROM {self.table}').fetchone()[0] or 0
+        self.next_id = max(self.meta.get('next_id', 1), max_id + 1)
+        self.generation = self.meta.get('generation', 0)
+        self.data_version = self.connection.execute('PRAGMA data_version').fetchone()[0]
+        self.log_seq = self.last_seq()
+        return self.select()
+
+    def last_seq(self):
+        return self.connection.execute(f'SELECT max(seq) FROM {self.table}_log').fetchone()[0] or 0
+
+    def changes(self):
+        with self._lock:
+            if self._fresh:
+                return []
+            # Блокировка записи держится до COMMIT, до него чужих изменений не будет
+            self._fresh = self._batch_depth > 0
+            # data_version меняется только после коммитов других соединений
+            version = self.connection.execute('PRAGMA data_version').fetchone()[0]
+            if version == self.data_version:
+                return []
+            self.data_version = version
+            log = self.connection.execute(f'SELECT seq, id FROM {self.table}_log WHERE seq > ? ORDER BY seq', (self.log_seq,)).fetchall()
+            if not log:
+                return []
+            # seq растёт без пропусков; пропуск значит, что старая часть журнала уже удалена
+            missed = log[0][0] != self.log_seq + 1
+            self.log_seq = log[-1][0]
+            self.generation += len(log)
+            if missed:
+                return None
+            ids = list(dict.fromkeys(row_id for _, row_id in log))
+            rows = {}
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                for row in self.select(f'id IN ({", ".join("?" * len(chunk))})', chunk):
+                    rows[row['id']] = row
+            self.next_id = max(self.next_id, max(ids) + 1)
+            return [(row_id, rows.get(row_id)) for row_id in ids]
+
+    def select(self, where='', params=(), order_by='id'):
+        sql = f'SELECT {", ".join(self.fields)} FROM {self.table}'
+        if where:
+            sql += f' WHERE {where}'
+        sql += f' ORDER BY {order_by}'
+        with self._lock:
+            rows = [dict(row) for row in self.connection.execute(sql, params)]
+        count('records_scanned', len(rows))
+        return rows
+
+    def get(self, row_id):
+        found = self.select('id = ?', (row_id,))
+        return found[0] if found else None
+
+    def iter_rows(self):
+        with self._lock:
+            cursor = self.connection.execute(f'SELECT {", ".join(self.fields)} FROM {self.table} ORDER BY id')
+        for row in cursor:
+            yield dict(row)
+
+    def insert(self, row):
+        with self._lock:
+            self._begin()
+            self.connection.execute(self._insert_sql, [row[field] for field in self.fields])
+            if row['id'] >= self.next_id:
+                self.next_id = row['id'] + 1
+            self.generation += 1
+            self._commit_later()
+
+    def _save_meta(self):
+        meta = dict(self.meta_source() if self.meta_source else {}, next_id=self.next_id, generation=self.generation)
+        self.connection.executemany(
+            f'INSERT OR REPLACE INTO {self.table}_meta VALUES (?, ?)',
+            [(key, json.dumps(value, ensure_ascii=False)) for key, value in meta.items()],
+        )
+
+    def update(self, row, old=None):
+        self.execute(self._insert_sql, [row[field] for field in self.fields])
+
+    def delete(self, row_id, old=None):
+        self.execute(f'DELETE FROM {self.table} WHERE id = ?', (row_id,))
+
+    def execute(self, sql, params):
+        with self._lock:
+            self._begin()
+            self.connection.execute(sql, params)
+            self.generation += 1
+            self._commit_later()
+
+    @contextmanager
+    def locked(self):
+        # BEGIN IMMEDIATE берёт блокировку записи до чтения изменений, как fcntl у журнала
+        with self._lock:
+            began = not self._dirty
+            if began:
+                self.connection.execute('BEGIN IMMEDIATE')
+                self._dirty = True
+            changes = self.connection.total_changes
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self.connection.total_changes != changes:
+                    # Собственные изменения не должны вернуться из changes() как чужие
+                    self.log_seq = self.last_seq()
+                    self.connection.execute(f'DELETE FROM {self.table}_log WHERE seq <= ?', (self.log_seq - CHANGE_LOG_LIMIT,))
+                    if not self._batch_depth:
+                        self._commit_later()
+                elif began and self._dirty and not self._batch_depth:
+                    self.connection.execute('COMMIT')
+                    self._dirty = False
+                    self._fresh = False
+
+    def rollback(self):
+        with self._lock:
+            if self._dirty:
+                self.connection.execute('ROLLBACK')
+                self._dirty = False
+            self._fresh = False
+
+    def _begin(self):
+        if not self._dirty:
+            self.connection.execute('BEGIN')
+            self._dirty = True
+
+    def _commit_later(self):
+        if self._batch_depth:
+            return
+        if not self.commit_window:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.commit_window, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                self._save_meta()
+                self.connection.execute('COMMIT')
+                self._dirty = False
+                self._fresh = False
+                self.syncs += 1
+
+    def batch(self):
+        return self.locked()
+
+    def compact(self):
+        with self.locked():
+            self.write_snapshot(self.snapshot())
+
+    def write_snapshot(self, rows):
+        with self.locked():
+            # Весь журнал изменений устаревает: остальные процессы увидят пропуск и перечитают таблицу
+            self.connection.execute(f'DELETE FROM {self.table}_log')
+            self.connection.execute(f'DELETE FROM {self.table}')
+            self.connection.executemany(self._insert_sql, ([row[field] for field in self.fields] for row in rows))
+            self.next_id = max(self.next_id, max((row['id'] for row in rows), default=0) + 1)
+            self.generation += 1
+            self._commit_later()
+        for hook in self.snapshot_hooks:
+            hook()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
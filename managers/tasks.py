@@ -1,39 +1,56 @@
-import json
-import csv
-from datetime import datetime
 import texts
+from managers.storage import LazyManager, ConflictError, open_store, index_by_id, resolve_id, date_key, valid_date
+from managers.csvio import stream_import, optional_int, parse_bool, format_import_stats, select_columns, row_getter, write_csv
+from managers.indexes import DateIndex, INVALID_DAY, epoch_day, parse_day, intern_text, sortable_date
+from managers.instrumentation import count, instrument
+from managers.querycache import cached_query
+
+FIELDS = ['id', 'title', 'description', 'done', 'priority', 'due_date']
+DUE_KEY = date_key('due_date')
+INDEXES = {'done': 'done', 'priority': 'priority', 'due_date': 'due_date', 'due_key': DUE_KEY}
 
 class Task:
+    __slots__ = ('id', 'title', 'description', 'done', 'priority', 'due_date', 'day')
+
     def __init__(self, title, description='', priority='Низкий', due_date=None):
         self.id = None
         self.title = title
         self.description = description
         self.done = False
-        self.priority = priority
-        self.due_date = due_date
+        self.priority = intern_text(priority)
+        self.due_date = intern_text(due_date)
+        self.day = parse_day(due_date)
 
-class TaskManager:
-    def __init__(self, filename='tasks.json'):
+@instrument
+class TaskManager(LazyManager):
+    lazy_fields = ('tasks', 'due_index')
+
+    def __init__(self, filename='tasks.json', commit_window=0.0, codec=None):
         self.filename = filename
+        self.storage = open_store(filename, self.task_rows, 'tasks', FIELDS, INDEXES, commit_window, codec=codec)
+
+    def load(self):
         self.tasks = self.load_tasks()
+        self.due_index = DateIndex(self.tasks.values())
 
     def load_tasks(self):
-        try:
-            with open(self.filename, 'r') as file:
-                tasks_data = json.load(file)
-                return [self.dict_to_task(task) for task in tasks_data]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        tasks, renumbered = index_by_id(map(self.dict_to_task, self.storage.load()), self.storage)
+        if renumbered:
+            self.storage.write_snapshot([self.task_to_dict(task) for task in tasks.values()])
+        return tasks
 
     def dict_to_task(self, task_dict):
         task = Task(task_dict['title'], task_dict.get('description', ''), task_dict.get('priority', 'Низкий'), task_dict.get('due_date', None))
         task.id = task_dict['id']
-        task.done = task_dict.get('done', False)
+        task.done = bool(task_dict.get('done', False))
         return task
 
     def save_tasks(self):
-        with open(self.filename, 'w') as file:
-            json.dump([self.task_to_dict(task) for task in self.tasks], file)
+        with self.mutation():
+            self.storage.compact()
+
+    def task_rows(self):
+        return [self.task_to_dict(task) for task in self.tasks.values()]
 
     def task_to_dict(self, task):
         return {
@@ -45,73 +62,153 @@ class TaskManager:
             'due_date': task.due_date
         }
 
+    def current_row(self, task_id):
+        if not self.loaded:
+            return self.storage.get(task_id)
+        task = self.tasks.get(task_id)
+        return self.task_to_dict(task) if task else None
+
+    def apply_row(self, task_id, row):
+        old_task = self.tasks.pop(task_id, None) if row is None else self.tasks.get(task_id)
+        if old_task:
+            self.due_index.remove(old_task.day, old_task.id)
+        if row is not None:
+            task = self.tasks[task_id] = self.dict_to_task(row)
+            self.due_index.add(task.day, task.id)
+
     def get_next_id(self):
-        if not self.tasks:
-            return 1
-        return max(task.id for task in self.tasks) + 1
+        self.ensure_loaded()
+        return self.storage.next_id
 
     def add_task(self, title, description='', priority='Низкий', due_date=None):
-        new_task = Task(title, description, priority, due_date)
-        new_task.id = self.get_next_id()
-        self.tasks.append(new_task)
-        self.save_tasks()
+        with self.mutation():
+            new_task = Task(title, description, priority, due_date)
+            new_task.id = self.get_next_id()
+            self.tasks[new_task.id] = new_task
+            self.due_index.add(new_task.day, new_task.id)
+            self.storage.insert(self.task_to_dict(new_task))
 
     def view_tasks(self):
-        return self.tasks
+        return list(self.tasks.values())
+
+    def get_task_by_id(self, task_id):
+        if self.loaded:
+            return self.tasks.get(task_id)
+        row = self.storage.get(task_id)
+        return self.dict_to_task(row) if row else None
 
     def mark_task_done(self, task_id):
-        for task in self.tasks:
-            if task.id == task_id:
+        with self.mutation():
+            task = self.tasks.get(task_id)
+            if task:
                 task.done = True
-                self.save_tasks()
+                self.storage.update(self.task_to_dict(task))
                 return True
-        return False
+            return False
 
-    def edit_task(self, task_id, title=None, description=None, priority=None, due_date=None):
-        for task in self.tasks:
-            if task.id == task_id:
+    def edit_task(self, task_id, title=None, description=None, priority=None, due_date=None, expected=None):
+        with self.mutation(task_id, expected):
+            task = self.tasks.get(task_id)
+            if task:
                 if title:
                     task.title = title
                 if description is not None:
                     task.description = description
                 if priority:
-                    task.priority = priority
+                    task.priority = intern_text(priority)
                 if due_date:
-                    task.due_date = due_date
-                self.save_tasks()
+                    self.due_index.remove(task.day, task.id)
+                    task.due_date = intern_text(due_date)
+                    task.day = parse_day(due_date)
+                    self.due_index.add(task.day, task.id)
+                self.storage.update(self.task_to_dict(task))
                 return True
-        return False
+            return False
 
     def delete_task(self, task_id):
-        self.tasks = [task for task in self.tasks if task.id != task_id]
-        self.save_tasks()
-
-    def export_to_csv(self, csv_filename):
-        with open(csv_filename, 'w', newline='') as csvfile:
-            fieldnames = ['id', 'title', 'description', 'done', 'priority', 'due_date']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            writer.writeheader()
-            for task in self.tasks:
-                writer.writerow(self.task_to_dict(task))
-
-    def import_from_csv(self, csv_filename):
-        with open(csv_filename, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                self.add_task(row['title'], row['description'], row['priority'], row['due_date'])
-
-    def filter_tasks(self, status=None, priority=None, due_date=None):
-        filtered_tasks = self.tasks
+        with self.mutation():
+            task = self.tasks.pop(task_id, None)
+            if task:
+                self.due_index.remove(task.day, task.id)
+                self.storage.delete(task_id)
+
+    def iter_task_rows(self, columns=FIELDS):
+        tasks = self.tasks.values() if self.loaded else map(self.dict_to_task, self.storage.iter_rows())
+        return map(row_getter(columns), tasks)
+
+    def export_to_csv(self, csv_filename, columns=None, compression=None):
+        columns = select_columns(FIELDS, columns)
+        write_csv(csv_filename, columns, self.iter_task_rows(columns), compression)
+
+    def import_from_csv(self, csv_filename, batch_size=10000, on_conflict='renumber', progress=None):
+        return stream_import(csv_filename, self.csv_to_task, lambda task: self.import_task(task, on_conflict), self.mutation, batch_size, progress, self.index_imported)
+
+    def index_imported(self, tasks):
+        # Индекс сроков пополняется один раз на пачку, а не вставкой по одной задаче
+        self.due_index.add_many(tasks)
+
+    def csv_to_task(self, row):
+        task = Task(row['title'], row.get('description', ''), row.get('priority') or 'Низкий', row.get('due_date') or None)
+        task.id = optional_int(row.get('id'))
+        task.done = parse_bool(row.get('done', ''))
+        return task
+
+    def import_task(self, task, on_conflict='renumber'):
+        status = resolve_id(self.tasks, task, self.storage, on_conflict)
+        if status == 'skipped':
+            return status
+        if status == 'replaced':
+            old_task = self.tasks[task.id]
+            self.due_index.remove(old_task.day, old_task.id)
+            self.tasks[task.id] = task
+            self.storage.update(self.task_to_dict(task))
+        else:
+            self.storage.insert(self.task_to_dict(task))
+        return status
+
+    @cached_query()
+    def filter_tasks(self, status=None, priority=None, due_date=None, due_from=None, due_to=None):
+        if self.storage.indexed:
+            return self.query_tasks(status, priority, due_date, due_from, due_to)
+        filtered_tasks = self.tasks.values()
+        if due_from or due_to:
+            task_ids = self.due_index.range(epoch_day(due_from) if due_from else None, epoch_day(due_to) if due_to else None)
+            filtered_tasks = [self.tasks[task_id] for task_id in task_ids]
+        if due_date is not None:
+            day = parse_day(due_date)
+            if day != INVALID_DAY and not (due_from or due_to):
+                filtered_tasks = [self.tasks[task_id] for task_id in self.due_index.range(day, day)]
+            filtered_tasks = [task for task in filtered_tasks if task.due_date == due_date]
+        count('records_scanned', len(filtered_tasks))
         if status is not None:
             filtered_tasks = [task for task in filtered_tasks if task.done == status]
         if priority is not None:
             filtered_tasks = [task for task in filtered_tasks if task.priority == priority]
+        return list(filtered_tasks)
+
+    def query_tasks(self, status, priority, due_date, due_from=None, due_to=None):
+        conditions, params = [], []
+        if status is not None:
+            conditions.append('done = ?')
+            params.append(int(status))
+        if priority is not None:
+            conditions.append('priority = ?')
+            params.append(priority)
         if due_date is not None:
-            filtered_tasks = [task for task in filtered_tasks if task.due_date == due_date]
-        return filtered_tasks
+            conditions.append('due_date = ?')
+            params.append(due_date)
+        if due_from:
+            conditions.append(f'{DUE_KEY} >= ?')
+            params.append(sortable_date(due_from))
+        if due_to:
+            conditions.append(f'{DUE_KEY} <= ?')
+            params.append(sortable_date(due_to))
+        if due_from or due_to:
+            conditions.append(valid_date('due_date'))
+        return [self.dict_to_task(task) for task in self.storage.select(' AND '.join(conditions), params)]
 
 def manage_tasks(task_manager: TaskManager) -> None:
+    task_manager.sync()
     print(texts.TASKS)
     action = input("Выберите действие: ")
     if action == "1":
@@ -141,11 +238,15 @@ def manage_tasks(task_manager: TaskManager) -> None:
         task_manager.mark_task_done(task_id)
     elif action == "4":
         task_id = int(input("Введите id задачи: "))
+        version = task_manager.version(task_id)
         title = input("Введите новое название задачи (оставьте пустым для пропуска): ")
         description = input("Введите новое описание задачи (оставьте пустым для пропуска): ")
         priority = input("Введите новый приоритет (оставьте пустым для пропуска): ")
         due_date = input("Введите новый срок выполнения (оставьте пустым для пропуска): ")
-        task_manager.edit_task(task_id, title or None, description or None, priority or None, due_date or None)
+        try:
+            task_manager.edit_task(task_id, title or None, description or None, priority or None, due_date or None, expected=version)
+        except ConflictError as error:
+            print(error)
     elif action == "5":
         task_id = int(input("Введите id задачи: "))
         task_manager.delete_task(task_id)
@@ -154,4 +255,4 @@ def manage_tasks(task_manager: TaskManager) -> None:
         task_manager.export_to_csv(filename)
     elif action == "7":
         filename = input("Введите имя файла: ")
-        task_manager.import_from_csv(filename)
+        print(format_import_stats(task_manager.import_from_csv(filename)))
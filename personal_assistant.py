@@ -3,32 +3,46 @@ from managers.tasks import TaskManager, manage_tasks
 from managers.contacts import ContactsManager, manage_contacts
 from managers.finances import FinanceManager, manage_finances
 from managers.calc import Calculator, calculate
+from managers.instrumentation import profiled
+from managers.storage import CorruptStoreError
+import sys
 import texts
 
+SECTIONS = {
+    "1": (NotesManager, manage_notes),
+    "2": (TaskManager, manage_tasks),
+    "3": (ContactsManager, manage_contacts),
+    "4": (FinanceManager, manage_finances),
+    "5": (Calculator, calculate),
+}
+
 def main():
-    notes_manager = NotesManager()
-    task_manager = TaskManager()
-    contacts_manager = ContactsManager()
-    finance_manager = FinanceManager()
-    calculator = Calculator()
+    # Менеджеры создаются при первом входе в раздел
+    managers = {}
 
     print("Добро пожаловать в Персональный помощник!")
 
     while True:
         print(texts.GREETINGS)
         action = input("Выберите действие: ")
-        if action == "1":
-            manage_notes(notes_manager)
-        elif action ==  "2":
-            manage_tasks(task_manager)
-        elif action == "3":
-            manage_contacts(contacts_manager)
-        elif action == "4":
-            manage_finances(finance_manager)
-        elif action == "5":
-            calculate(calculator)
-        else:
+        if action not in SECTIONS:
             break
+        factory, manage = SECTIONS[action]
+        if action not in managers:
+            managers[action] = factory()
+        try:
+            manage(managers[action])
+        except CorruptStoreError as error:
+            # Раздел с повреждённым файлом недоступен, остальные работают; при следующем входе файл читается заново
+            print(error)
+            del managers[action]
 
 if __name__ == "__main__":
-    main()
+    # С аргументами командной строки помощник работает без меню: python personal_assistant.py tasks add ...
+    # Модуль командной строки тянет за собой сервер и asyncio, поэтому меню его не импортирует
+    if len(sys.argv) > 1:
+        from managers.cli import main as run_cli
+        sys.exit(run_cli(sys.argv[1:]))
+    # ASSISTANT_PROFILE=каталог сохраняет профиль сеанса
+    with profiled():
+        main()
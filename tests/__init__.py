@@ -0,0 +1 @@
+# Запуск из корня репозитория: python -m unittest discover -s tests -t .
@@ -0,0 +1,30 @@
+import os
+import tempfile
+import unittest
+
+from managers.contacts import ContactsManager
+
+
+class SearchContactTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.manager = ContactsManager(os.path.join(directory.name, 'contacts.json'))
+        self.manager.add_contact('Иван Петров', '+7 900 123-45-67', 'ivan@example.com')
+        self.manager.add_contact('Анна Смирнова', '+7 900 765-43-21')
+
+    def test_empty_query_lists_all(self):
+        self.assertEqual(len(self.manager.search_contact('')), 2)
+        self.assertEqual(len(self.manager.search_contact('  ')), 2)
+
+    def test_punctuation_only_query_finds_nothing(self):
+        for query in ('@', '-', '+'):
+            self.assertEqual(self.manager.search_contact(query), [])
+
+    def test_name_prefix_and_phone(self):
+        self.assertEqual([contact.name for contact in self.manager.search_contact('пет')], ['Иван Петров'])
+        self.assertEqual([contact.name for contact in self.manager.search_contact('765')], ['Анна Смирнова'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+
+from managers.finances import FinanceManager
+from managers.tasks import TaskManager
+
+
+class DateErrorsTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def managers(self):
+        for suffix in ('.json', '.db'):
+            yield FinanceManager(os.path.join(self.directory, 'finance' + suffix)).filter_records, 'start_date'
+            yield TaskManager(os.path.join(self.directory, 'tasks' + suffix)).filter_tasks, 'due_from'
+
+    def test_malformed_bounds_raise_localized_error(self):
+        for method, parameter in self.managers():
+            for value in ('1-1', '2024-01-01', '31-02-2024'):
+                with self.assertRaisesRegex(ValueError, '^Ошибка: неверная дата'):
+                    method(**{parameter: value})
+
+    def test_sqlite_range_matches_json(self):
+        results = []
+        for suffix in ('.json', '.db'):
+            manager = FinanceManager(os.path.join(self.directory, 'finance' + suffix))
+            for date in ('31-12-2023', '01-01-2024', '15-01-2024', '01-02-2024'):
+                manager.add_record('1.00', 'a', date)
+            results.append([record['date'] for record in manager.filter_records(start_date='1-1-2024', end_date='31-01-2024')])
+        self.assertEqual(results[0], ['01-01-2024', '15-01-2024'])
+        self.assertEqual(sorted(results[1]), results[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
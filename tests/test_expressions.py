@@ -0,0 +1,44 @@
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from managers import expressions
+from managers.calc import Calculator
+from managers.expressions import Expression
+
+
+class DecimalValuesTest(unittest.TestCase):
+    def test_evaluate_accepts_decimal(self):
+        self.assertEqual(Calculator().evaluate('a*2', {'a': Decimal('1.5')}), 3.0)
+
+    def test_evaluate_rejects_text(self):
+        with self.assertRaises(ValueError):
+            Calculator().evaluate('a*2', {'a': 'x'})
+
+    def test_evaluate_many_accepts_decimal_column_and_scalar(self):
+        result = Calculator().evaluate_many('a*k', {'a': [Decimal('1.5'), 2], 'k': Decimal('2')})
+        self.assertEqual(result, [3.0, 4.0])
+
+    def test_loop_path_matches_vector_path(self):
+        columns = {'a': [Decimal('1.5'), 2], 'k': Decimal('2')}
+        vector = Expression('a*k').evaluate_many(columns)
+        with mock.patch.object(expressions, 'numpy', return_value=None):
+            loop = Expression('a*k').evaluate_many(columns)
+            with self.assertRaises(ValueError):
+                Expression('a*2').evaluate_many({'a': ['x']})
+        self.assertEqual(loop, vector)
+
+
+class NonRealResultsTest(unittest.TestCase):
+    def test_complex_power_is_rejected(self):
+        self.assertIn('недопустимое значение аргумента', Calculator().calculate('(-8)**(1/3)'))
+
+    def test_infinite_result_is_rejected(self):
+        for expression in ('1e400', '1e308*10', '1e400-1e400'):
+            self.assertEqual(Calculator().calculate(expression), expressions.TOO_LARGE)
+        with self.assertRaises(ValueError):
+            Calculator().evaluate_many('x*1e400', {'x': [1.0]})
+
+
+if __name__ == '__main__':
+    unittest.main()
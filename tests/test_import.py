@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+from managers.finances import FinanceManager
+from managers.tasks import TaskManager
+
+
+class ImportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def write(self, name, text):
+        with open(self.path(name), 'w', encoding='utf-8') as csvfile:
+            csvfile.write(text)
+        return self.path(name)
+
+
+class ConflictModesTest(ImportTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = FinanceManager(self.path('finance.json'))
+        self.manager.add_record('1.00', 'a', '01-01-2024')
+        self.manager.add_record('2.00', 'a', '02-01-2024')
+        self.csv_filename = self.write('in.csv', 'id,amount,category,date,description\n2,50,b,03-01-2024,\n7,5,c,04-01-2024,\n,1,d,05-01-2024,\nx,oops,e,06-01-2024,\n')
+
+    def reload(self):
+        return FinanceManager(self.path('finance.json'))
+
+    def test_renumber(self):
+        stats = self.manager.import_from_csv(self.csv_filename)
+        self.assertEqual(stats, {'renumbered': 1, 'imported': 2, 'invalid': 1})
+        records = self.reload().records
+        self.assertEqual(len(records), 5)
+        self.assertEqual(str(records[2].amount), '2.00')
+        self.assertEqual(records[7].category, 'c')
+        self.assertEqual(len(set(records)), 5)
+
+    def test_skip(self):
+        stats = self.manager.import_from_csv(self.csv_filename, on_conflict='skip')
+        self.assertEqual(stats, {'skipped': 1, 'imported': 2, 'invalid': 1})
+        records = self.reload().records
+        self.assertEqual(str(records[2].amount), '2.00')
+        self.assertEqual(len(records), 4)
+
+    def test_replace(self):
+        stats = self.manager.import_from_csv(self.csv_filename, on_conflict='replace')
+        self.assertEqual(stats, {'replaced': 1, 'imported': 2, 'invalid': 1})
+        reloaded = self.reload()
+        self.assertEqual(str(reloaded.records[2].amount), '50.00')
+        self.assertEqual(reloaded.records[2].date, '03-01-2024')
+        self.assertEqual(str(reloaded.calculate_balance()), '57.00')
+        self.assertEqual([record['id'] for record in reloaded.filter_records(start_date='02-01-2024', end_date='02-01-2024')], [])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            self.manager.import_from_csv(self.csv_filename, on_conflict='merge')
+        self.assertEqual(len(self.reload().records), 2)
+
+
+class DuplicateIdsInBatchTest(ImportTestCase):
+    def test_finance_replace_keeps_last_record(self):
+        csv_filename = self.write('in.csv', 'id,amount,category,date,description\n1,10,a,01-01-2024,\n1,20,a,01-02-2024,\n')
+        manager = FinanceManager(self.path('finance.json'))
+        manager.import_from_csv(csv_filename, on_conflict='replace')
+        self.assertEqual([record['id'] for record in manager.filter_records(start_date='01-01-2024', end_date='31-12-2024')], [1])
+        manager.save_records()
+        reloaded = FinanceManager(self.path('finance.json'))
+        self.assertEqual(sorted(reloaded.records), [1])
+        self.assertEqual(str(reloaded.calculate_balance()), '20.00')
+        self.assertEqual(reloaded.filter_records(start_date='01-01-2024', end_date='31-01-2024'), [])
+
+    def test_tasks_replace_keeps_one_due_entry(self):
+        csv_filename = self.write('in.csv', 'id,title,description,priority,due_date,done\n1,a,,Низкий,01-01-2024,\n1,b,,Низкий,01-02-2024,\n')
+        manager = TaskManager(self.path('tasks.json'))
+        manager.import_from_csv(csv_filename, on_conflict='replace')
+        self.assertEqual(list(manager.due_index.ids), [1])
+        self.assertEqual(len(manager.filter_tasks(due_from='01-01-2024')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import unittest
+
+from managers.finances import FinanceManager
+
+
+class SegmentRewriteTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, 'finance.json')
+        self.manager = FinanceManager(self.filename)
+        for amount, date in (('10.00', '05-01-2024'), ('-3.50', '06-01-2024'), ('20.00', '10-02-2024'), ('7.25', '15-03-2024')):
+            self.manager.add_record(amount, 'a', date)
+        self.manager.save_records()
+
+    def segment_files(self):
+        with open(self.filename) as file:
+            return {name: entry['file'] for name, entry in json.load(file)['segments'].items()}
+
+    def test_months_are_written_to_separate_segments(self):
+        self.assertEqual(sorted(self.segment_files()), ['2024-01', '2024-02', '2024-03'])
+
+    def test_only_touched_segments_are_rewritten(self):
+        before = self.segment_files()
+        self.manager.edit_record(1, amount='11.00')
+        self.manager.save_records()
+        after = self.segment_files()
+        self.assertEqual([name for name in after if after[name] != before[name]], ['2024-01'])
+
+    def test_moved_record_rewrites_both_months(self):
+        before = self.segment_files()
+        self.manager.edit_record(3, date='20-03-2024')
+        self.manager.delete_record(2)
+        self.manager.save_records()
+        after = self.segment_files()
+        self.assertEqual(sorted(name for name in set(before) | set(after) if after.get(name) != before.get(name)), ['2024-01', '2024-02', '2024-03'])
+        # Опустевший месяц убирается из манифеста
+        self.assertNotIn('2024-02', after)
+
+        reloaded = FinanceManager(self.filename)
+        self.assertEqual(sorted(reloaded.records), [1, 3, 4])
+        self.assertEqual(str(reloaded.calculate_balance()), '37.25')
+        self.assertTrue(reloaded.verify_totals())
+        self.assertEqual([record['id'] for record in reloaded.filter_records(start_date='01-03-2024', end_date='31-03-2024')], [4, 3])
+        self.assertEqual(reloaded.filter_records(start_date='01-02-2024', end_date='29-02-2024'), [])
+
+    def test_unloaded_range_read_sees_journal(self):
+        self.manager.add_record('1.00', 'b', '01-02-2024')
+        unloaded = FinanceManager(self.filename)
+        records = unloaded.filter_records(start_date='01-02-2024', end_date='29-02-2024')
+        self.assertFalse(unloaded.loaded)
+        self.assertEqual(sorted(record['id'] for record in records), [3, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from managers.server import AssistantService
+
+
+class ClientPathTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_dir = os.path.realpath(directory.name)
+        self.service = AssistantService(self.data_dir, commit_window=0.0)
+        self.addCleanup(self.service.close)
+
+    def request(self, **request):
+        async def send():
+            return await self.service.submit(json.dumps(request))
+        return json.loads(asyncio.run(send()))
+
+    def test_rejects_paths_outside_data_dir(self):
+        for filename in ('/tmp/outside.csv', '../outside.csv', 'a/../../outside.csv'):
+            for method in ('export_to_csv', 'import_from_csv'):
+                response = self.request(section='notes', method=method, args=[filename])
+                self.assertIn('каталог данных', response['error'])
+
+    def test_files_are_written_in_data_dir(self):
+        self.request(section='notes', method='create_note', args=['a'])
+        self.request(section='notes', method='export_to_csv', params={'csv_filename': 'out.csv'})
+        self.request(section='notes', method='export_to_csv')
+        self.assertTrue(os.path.exists(os.path.join(self.data_dir, 'out.csv')))
+        self.assertTrue(os.path.exists(os.path.join(self.data_dir, 'notes.csv')))
+        response = self.request(section='finances', method='generate_report', args=['01-01-2024', '31-01-2024'])
+        self.assertEqual(os.path.dirname(response['result']['report_filename']), self.data_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+from managers.notes import NotesManager
+from managers.storage import CorruptStoreError
+
+
+class StorageTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+
+class CorruptSnapshotTest(StorageTestCase):
+    def test_corrupt_snapshot_blocks_manager(self):
+        with open(self.path('notes.json'), 'w') as file:
+            file.write('[{"id": 1, "title": "a", "con')
+        manager = NotesManager(self.path('notes.json'))
+        with self.assertRaises(CorruptStoreError):
+            manager.create_note('b', '')
+        with self.assertRaises(CorruptStoreError):
+            manager.get_note_by_id(1)
+        with open(self.path('notes.json')) as file:
+            self.assertTrue(file.read().startswith('[{"id": 1'))
+        self.assertFalse(os.path.exists(self.path('notes.json.journal')) and os.path.getsize(self.path('notes.json.journal')))
+
+
+class JournalReplayTest(StorageTestCase):
+    def test_truncated_tail_is_dropped_and_repaired(self):
+        manager = NotesManager(self.path('notes.json'))
+        manager.create_note('a', '1')
+        manager.create_note('b', '2')
+        journal = self.path('notes.json.journal')
+        valid_size = os.path.getsize(journal)
+        with open(journal, 'ab') as file:
+            file.write(b'{"op": "insert", "row": {"id": 3, "tit')
+
+        reloaded = NotesManager(self.path('notes.json'))
+        self.assertEqual([note.title for note in reloaded.notes.values()], ['a', 'b'])
+        self.assertEqual(os.path.getsize(journal), valid_size)
+        reloaded.create_note('c', '3')
+        self.assertEqual(sorted(NotesManager(self.path('notes.json')).notes), [1, 2, 3])
+
+    def test_updates_and_deletes_are_replayed(self):
+        manager = NotesManager(self.path('notes.json'))
+        for title in ('a', 'b', 'c'):
+            manager.create_note(title)
+        manager.edit_note(1, title='A')
+        manager.delete_note(2)
+        reloaded = NotesManager(self.path('notes.json'))
+        self.assertEqual({note_id: note.title for note_id, note in reloaded.notes.items()}, {1: 'A', 3: 'c'})
+
+
+class CompactionTest(StorageTestCase):
+    def test_compaction_empties_journal_and_reloads(self):
+        manager = NotesManager(self.path('notes.json'))
+        for title in ('a', 'b', 'c'):
+            manager.create_note(title)
+        manager.delete_note(2)
+        manager.save_notes()
+        self.assertEqual(os.path.getsize(self.path('notes.json.journal')), 0)
+        reloaded = NotesManager(self.path('notes.json'))
+        self.assertEqual(sorted(reloaded.notes), [1, 3])
+        # id удалённой записи не выдаётся повторно
+        reloaded.create_note('d')
+        self.assertEqual(sorted(NotesManager(self.path('notes.json')).notes), [1, 3, 4])
+
+    def test_automatic_compaction(self):
+        manager = NotesManager(self.path('notes.json'))
+        manager.storage.compact_every = 5
+        for number in range(7):
+            manager.create_note(f'note {number}')
+        self.assertEqual(manager.storage.pending, 2)
+        self.assertEqual(len(NotesManager(self.path('notes.json')).notes), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
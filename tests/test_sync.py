@@ -0,0 +1,37 @@
+import os
+import tempfile
+import unittest
+
+from managers.finances import FinanceManager
+
+
+class UnloadedSyncTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, 'finance.json')
+        manager = FinanceManager(self.filename)
+        for day in range(1, 4):
+            manager.add_record('1.00', 'a', f'0{day}-01-2024')
+        manager.save_records()
+
+    def test_sync_keeps_query_cache_of_unloaded_manager(self):
+        manager = FinanceManager(self.filename)
+        for _ in range(3):
+            manager.sync()
+            records = manager.filter_records(start_date='01-01-2024', end_date='31-01-2024')
+        self.assertFalse(manager.loaded)
+        self.assertEqual(len(records), 3)
+        self.assertEqual(manager.query_cache.hits, 2)
+
+    def test_sync_sees_other_writer(self):
+        manager = FinanceManager(self.filename)
+        manager.sync()
+        manager.filter_records(start_date='01-01-2024', end_date='31-01-2024')
+        FinanceManager(self.filename).add_record('2.00', 'b', '04-01-2024')
+        manager.sync()
+        self.assertEqual(len(manager.filter_records(start_date='01-01-2024', end_date='31-01-2024')), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,7 +15,8 @@ NOTES = """Управление заметками:
 5. Удалить заметку
 6. Экспорт заметок в CSV
 7. Импорт заметок из CSV
-8. Назад
+8. Поиск заметок
+9. Назад
 """
 
 TASKS = """Управление задачами: